@@ -4,11 +4,141 @@
 """
 批量图片OCR处理示例脚本
 使用paddleocr_recognition.py中的OCRProcessor类进行批量图片处理
+支持使用多进程并行处理，每个工作进程持有独立的OCRProcessor实例
 """
 
 import os
+import queue
 import argparse
-from paddleocr_recognition import OCRProcessor
+import multiprocessing
+from paddleocr_recognition import OCRProcessor, list_image_files
+
+# 工作进程中的OCR处理器和输出目录（由_init_worker初始化）
+_processor = None
+_output_dir = None
+
+# 工作进程领取GPU编号的最长等待时间(秒)。进程池重建的工作进程领不到编号，超时后按进程号分配
+DEVICE_QUEUE_TIMEOUT = 5
+
+def get_gpu_count():
+    """获取可用的GPU数量，无法检测时返回0"""
+    try:
+        import paddle
+        return paddle.device.cuda.device_count()
+    except Exception:
+        return 0
+
+def default_jobs(use_gpu):
+    """
+    计算默认的并行进程数
+    
+    GPU模式下每块GPU一个进程；CPU模式下最多3个进程，
+    避免多个OCR模型同时运行时争抢CPU和内存
+    """
+    cpu_count = os.cpu_count() or 1
+    if use_gpu:
+        return max(1, min(cpu_count, get_gpu_count()))
+    return min(cpu_count, 3)
+
+def build_ocr_options(args, jobs):
+    """
+    根据命令行参数构建PaddleOCR的高性能推理参数
+    
+    GPU模式默认使用TensorRT + FP16，并增大识别和分类的批大小；
+    CPU模式默认开启MKL-DNN，并将CPU线程平均分配给各个工作进程
+    """
+    options = {'det_limit_side_len': args.det_limit_side_len}
+    if args.gpu:
+        options['precision'] = args.precision or 'fp16'
+        options['use_tensorrt'] = True if args.use_tensorrt is None else args.use_tensorrt
+        options['min_subgraph_size'] = 15
+        # GPU上文本行识别和方向分类使用更大的批次，充分利用显卡并行能力
+        batch = args.batch or 32
+        options['rec_batch_num'] = batch
+        options['cls_batch_num'] = batch
+    else:
+        options['precision'] = args.precision or 'fp32'
+        options['enable_mkldnn'] = True
+        options['cpu_threads'] = args.cpu_threads or max(1, (os.cpu_count() or 1) // jobs)
+        if args.batch:
+            options['rec_batch_num'] = args.batch
+            options['cls_batch_num'] = args.batch
+    return options
+
+def _init_worker(use_gpu, lang, output_dir, device_queue, ocr_options):
+    """进程池初始化函数，在每个工作进程中创建独立的OCRProcessor"""
+    global _processor, _output_dir
+    gpu_id = 0
+    if use_gpu:
+        try:
+            gpu_id = device_queue.get(timeout=DEVICE_QUEUE_TIMEOUT)
+        except queue.Empty:
+            gpu_id = os.getpid() % max(1, get_gpu_count())
+    _output_dir = output_dir
+    _processor = OCRProcessor(
+        use_gpu=use_gpu,
+        lang=lang,
+        use_angle_cls=True,
+        gpu_id=gpu_id,
+        **ocr_options
+    )
+    if use_gpu:
+        _processor.warmup()
+
+def _process_file(img_path):
+    """在工作进程中处理单张图片，返回(图片路径, 识别结果)，识别出错时识别结果为None"""
+    try:
+        result = _processor.recognize_image(img_path)
+    except Exception as e:
+        print(f"处理图片 {img_path} 时出错: {e}")
+        return img_path, None
+    
+    # 识别已成功，保存出错也保留识别结果(与单进程时process_directory的行为一致)
+    try:
+        _processor.save_result(img_path, result, _output_dir)
+    except Exception as e:
+        print(f"保存图片 {img_path} 的识别结果时出错: {e}")
+    return img_path, result
+
+def process_with_pool(image_files, output_dir, use_gpu, lang, jobs, ocr_options=None):
+    """
+    使用进程池并行处理图片
+    
+    参数:
+        image_files: 图片文件路径列表
+        output_dir: 输出目录路径
+        use_gpu: 是否使用GPU加速
+        lang: 识别语言
+        jobs: 工作进程数
+        ocr_options: 传给OCRProcessor的推理参数
+    
+    返回:
+        results: 处理结果字典，键为图片路径，值为识别结果
+    """
+    # 使用spawn方式创建进程，避免子进程继承父进程的CUDA状态
+    ctx = multiprocessing.get_context('spawn')
+    
+    # 为每个工作进程分配GPU编号，多块GPU时轮流分配
+    gpu_count = max(1, get_gpu_count()) if use_gpu else 1
+    device_queue = ctx.Queue()
+    for worker_id in range(jobs):
+        device_queue.put(worker_id % gpu_count)
+    
+    results = {}
+    total = len(image_files)
+    chunksize = max(1, min(8, total // (jobs * 4)))
+    
+    with ctx.Pool(
+        processes=jobs,
+        initializer=_init_worker,
+        initargs=(use_gpu, lang, output_dir, device_queue, ocr_options or {})
+    ) as pool:
+        for i, (img_path, result) in enumerate(pool.imap_unordered(_process_file, image_files, chunksize=chunksize)):
+            print(f"已完成 [{i+1}/{total}]: {img_path}")
+            if result is not None:
+                results[img_path] = result
+    
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description='批量图片OCR处理示例')
@@ -16,6 +146,20 @@ def main():
     parser.add_argument('-o', '--output_dir', help='输出结果目录路径')
     parser.add_argument('-l', '--lang', default='ch', help='识别语言, 默认为中文(ch)')
     parser.add_argument('--gpu', action='store_true', help='是否使用GPU加速')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='并行进程数，默认GPU模式下为GPU数量，CPU模式下最多3个')
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'int8'], default=None,
+                        help='推理精度，GPU模式默认为fp16，CPU模式默认为fp32')
+    parser.add_argument('--use-tensorrt', dest='use_tensorrt', action='store_true', default=None,
+                        help='使用TensorRT加速(GPU模式默认开启)')
+    parser.add_argument('--no-tensorrt', dest='use_tensorrt', action='store_false',
+                        help='GPU模式下不使用TensorRT')
+    parser.add_argument('--cpu-threads', type=int, default=None,
+                        help='CPU模式下每个进程的推理线程数，默认平均分配CPU核心')
+    parser.add_argument('--det-limit-side-len', type=int, default=640,
+                        help='文本检测时图片长边的缩放上限，默认为640(快速模式)')
+    parser.add_argument('-b', '--batch', type=int, default=None,
+                        help='文本行识别和方向分类的批大小，GPU模式默认为32，CPU模式使用PaddleOCR默认值')
     
     args = parser.parse_args()
     
@@ -23,17 +167,35 @@ def main():
     if args.output_dir and not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
     
-    # 初始化OCR处理器
-    print("初始化OCR处理器...")
-    processor = OCRProcessor(
-        use_gpu=args.gpu,
-        lang=args.lang,
-        use_angle_cls=True
-    )
+    image_files = list_image_files(args.input_dir)
+    if not image_files:
+        print(f"警告: 目录 {args.input_dir} 中没有找到支持的图片文件")
+        return
+    
+    jobs = args.jobs or default_jobs(args.gpu)
+    jobs = max(1, min(jobs, len(image_files)))
+    
+    ocr_options = build_ocr_options(args, jobs)
     
-    # 处理图片目录
     print(f"开始处理目录: {args.input_dir}")
-    results = processor.process_directory(args.input_dir, args.output_dir)
+    if jobs > 1:
+        # 多进程并行处理，每个进程初始化自己的OCR处理器
+        print(f"使用 {jobs} 个进程并行处理...")
+        results = process_with_pool(image_files, args.output_dir, args.gpu, args.lang, jobs, ocr_options)
+    else:
+        # 初始化OCR处理器
+        print("初始化OCR处理器...")
+        processor = OCRProcessor(
+            use_gpu=args.gpu,
+            lang=args.lang,
+            use_angle_cls=True,
+            **ocr_options
+        )
+        if args.gpu:
+            processor.warmup()
+        
+        # 处理图片目录
+        results = processor.process_directory(args.input_dir, args.output_dir)
     
     # 统计结果
     total_files = len(results)
@@ -3,29 +3,257 @@
 
 """
 脚本功能: 将docx文档转换为markdown格式
-依赖库: python-docx, markdown
+依赖库: lxml
 使用方法: python docx_to_markdown.py 输入文件.docx [输出文件.md]
 """
 
+import io
 import os
 import sys
 import re
-import tempfile
 import zipfile
 import shutil
-from docx import Document
-from docx.enum.style import WD_STYLE_TYPE
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
+import functools
+from lxml import etree
+
+# 关系文件(document.xml.rels)的命名空间和Relationship元素标签
+RELS_NSMAP = {'r': 'http://schemas.openxmlformats.org/package/2006/relationships'}
+_REL_TAG = '{%s}Relationship' % RELS_NSMAP['r']
+
+# 解析关系文件使用的XML解析器：不收集ID、不解析实体
+_RELS_PARSER = etree.XMLParser(collect_ids=False, resolve_entities=False)
+
+# 关系文件无法按XML解析时，用于提取图片关系的正则表达式(直接匹配字节串)
+_REL_RE = re.compile(
+    rb'<Relationship Id="(rId\d+)"[^>]*Type="[^"]*image[^"]*"[^>]*Target="[^"]*/([^/"]+)"',
+    re.I
+)
+
+# document.xml中DrawingML和关系的命名空间，以及直接取出段落内图片(a:blip)rId的预编译XPath
+NSMAP = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+}
+_BLIP_EMBED_XPATH = etree.XPath('.//a:blip/@r:embed', namespaces=NSMAP)
+
+# WordprocessingML命名空间及用到的元素/属性标签
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+def _w(tag):
+    """返回WordprocessingML命名空间下的完整标签名"""
+    return '{%s}%s' % (W_NS, tag)
+
+W_BODY, W_P, W_TBL = _w('body'), _w('p'), _w('tbl')
+W_PPR, W_PSTYLE, W_NUMPR, W_NUMID = _w('pPr'), _w('pStyle'), _w('numPr'), _w('numId')
+W_R, W_HYPERLINK, W_TAB, W_BR, W_CR = _w('r'), _w('hyperlink'), _w('tab'), _w('br'), _w('cr')
+W_STYLE, W_NAME = _w('style'), _w('name')
+W_VAL, W_TYPE, W_DEFAULT, W_STYLE_ID = _w('val'), _w('type'), _w('default'), _w('styleId')
+
+# 表格行、单元格和文本节点的标签
+W_TR, W_TC, W_T = _w('tr'), _w('tc'), _w('t')
+# 表格网格及合并单元格相关的标签
+W_TBLGRID, W_GRIDCOL, W_TRPR, W_TCPR = _w('tblGrid'), _w('gridCol'), _w('trPr'), _w('tcPr')
+W_GRIDBEFORE, W_GRIDSPAN, W_VMERGE = _w('gridBefore'), _w('gridSpan'), _w('vMerge')
+
+# 段落内run中表示换行/制表的元素及其对应文本
+_RUN_SPECIAL_TEXT = {W_TAB: '\t', W_BR: '\n', W_CR: '\n'}
+
+# 解析document.xml和styles.xml使用的XML解析选项
+_XML_PARSER_OPTIONS = {'collect_ids': False, 'resolve_entities': False, 'huge_tree': True}
+
+@functools.lru_cache(maxsize=None)
+def classify_style(style_name):
+    """
+    根据样式名判断段落的标题级别和是否为列表样式
+    
+    Args:
+        style_name (str): 段落样式名
+    
+    Returns:
+        tuple: (标题级别，非标题为0, 是否为列表样式, 是否为文档标题样式)
+    """
+    style_name = style_name.lower()
+    heading_level = 0
+    if 'heading' in style_name:
+        if '1' in style_name:
+            heading_level = 1
+        elif '2' in style_name:
+            heading_level = 2
+        elif '3' in style_name:
+            heading_level = 3
+        elif '4' in style_name:
+            heading_level = 4
+        else:
+            heading_level = 5  # 默认最多5级标题
+    
+    is_list_style = 'bullet' in style_name or 'list' in style_name
+    is_title = style_name.startswith('title')
+    return heading_level, is_list_style, is_title
+
+def build_style_cache(styles_xml):
+    """
+    遍历styles.xml中的样式一次，建立段落样式ID到分类结果的映射
+    
+    Args:
+        styles_xml (bytes): word/styles.xml的内容，文档没有样式部件时为None
+    
+    Returns:
+        tuple: (样式ID到classify_style分类结果的字典, 默认段落样式的分类结果)
+    """
+    style_cache = {}
+    default_info = classify_style('')
+    if styles_xml is None:
+        return style_cache, default_info
+    
+    root = etree.fromstring(styles_xml, parser=etree.XMLParser(**_XML_PARSER_OPTIONS))
+    for style in root.iterchildren(W_STYLE):
+        if style.get(W_TYPE) != 'paragraph':
+            continue
+        name_elem = style.find(W_NAME)
+        info = classify_style(name_elem.get(W_VAL, '') if name_elem is not None else '')
+        style_cache[style.get(W_STYLE_ID)] = info
+        
+        # 未指定样式或样式不存在的段落使用默认段落样式
+        if style.get(W_DEFAULT) in ('1', 'true', 'on'):
+            default_info = info
+    
+    return style_cache, default_info
+
+def paragraph_text(p):
+    """
+    获取段落的纯文本(包括超链接中的文字，制表符和换行转换为对应字符)
+    
+    Args:
+        p (etree._Element): w:p元素
+    
+    Returns:
+        str: 段落文本
+    """
+    parts = []
+    for child in p.iterchildren(W_R, W_HYPERLINK):
+        runs = (child,) if child.tag == W_R else child.iterchildren(W_R)
+        for run in runs:
+            for node in run.iterchildren(W_T, W_TAB, W_BR, W_CR):
+                if node.tag == W_T:
+                    parts.append(node.text or '')
+                else:
+                    parts.append(_RUN_SPECIAL_TEXT[node.tag])
+    return ''.join(parts)
+
+def cell_text(tc):
+    """
+    获取表格单元格的文本，单元格内的多个段落以空格连接(markdown表格的一行中不能换行)
+    
+    Args:
+        tc (etree._Element): w:tc元素
+    
+    Returns:
+        str: 单元格文本
+    """
+    paragraphs = (''.join(t.text or '' for t in p.iter(W_T)).strip() for p in tc.iter(W_P))
+    return ' '.join(text for text in paragraphs if text)
+
+def _int_val(parent, tag, default):
+    """读取parent下子元素tag的w:val整数属性，不存在时返回default"""
+    el = parent.find(tag) if parent is not None else None
+    if el is None:
+        return default
+    try:
+        return int(el.get(W_VAL, default))
+    except ValueError:
+        return default
+
+def row_cells(tr, column_texts):
+    """
+    获取表格行按网格列展开后的单元格文本
+    
+    横向合并的单元格(w:gridSpan)按所跨列数重复文本，纵向合并的后续单元格(w:vMerge)
+    重复上方单元格的文本，与python-docx的row.cells一致，保证每行的列数与表格网格一致
+    
+    Args:
+        tr (etree._Element): w:tr元素
+        column_texts (dict): 网格列序号到该列最近一个单元格文本的映射，逐行更新
+    
+    Returns:
+        list: 单元格文本列表
+    """
+    # 行首跳过的网格列
+    cells = [" "] * _int_val(tr.find(W_TRPR), W_GRIDBEFORE, 0)
+    for tc in tr.iterchildren(W_TC):
+        tcPr = tc.find(W_TCPR)
+        span = max(1, _int_val(tcPr, W_GRIDSPAN, 1))
+        v_merge = tcPr.find(W_VMERGE) if tcPr is not None else None
+        
+        col = len(cells)
+        if v_merge is not None and v_merge.get(W_VAL, 'continue') == 'continue':
+            text = column_texts.get(col, " ")
+        else:
+            text = cell_text(tc) or " "
+        for i in range(col, col + span):
+            column_texts[i] = text
+        cells.extend([text] * span)
+    return cells
+
+def table_to_markdown(tbl, buf):
+    """
+    将表格转换为markdown并写入缓冲区(直接遍历表格XML，每个表格只走一遍)
+    
+    Args:
+        tbl (etree._Element): w:tbl元素
+        buf (io.StringIO): markdown输出缓冲区
+    """
+    column_texts = {}
+    rows = (row_cells(tr, column_texts) for tr in tbl.iterchildren(W_TR))
+    
+    # 处理表头
+    header_row = next(rows, None)
+    if header_row is None:
+        buf.write("\n")
+        return
+    
+    # 列数取表格网格列数和表头列数中的较大者，列数不足的行以空单元格补齐
+    tbl_grid = tbl.find(W_TBLGRID)
+    grid_cols = len(tbl_grid.findall(W_GRIDCOL)) if tbl_grid is not None else 0
+    width = max(grid_cols, len(header_row))
+    header_row += [" "] * (width - len(header_row))
+    
+    buf.write("| " + " | ".join(header_row) + " |\n")
+    
+    # 添加分隔行
+    buf.write("| " + " | ".join(["---"] * len(header_row)) + " |\n")
+    
+    # 处理数据行
+    for data_row in rows:
+        data_row += [" "] * (width - len(data_row))
+        buf.write("| " + " | ".join(data_row) + " |\n")
+    
+    # 添加空行
+    buf.write("\n")
 
 def extract_images(docx_path, output_dir):
     """
     从docx文件中提取图片并保存到指定目录
     
+    直接从ZIP包中流式读取word/media下的图片和关系文件，不解压整个文档
+    
     Args:
         docx_path (str): docx文件路径
         output_dir (str): 图片输出目录
     
+    Returns:
+        dict: 图片ID与输出路径的映射
+    """
+    with zipfile.ZipFile(docx_path, 'r') as zip_ref:
+        return extract_images_from_zip(zip_ref, output_dir)
+
+def extract_images_from_zip(zip_ref, output_dir):
+    """
+    从已打开的docx ZIP包中提取图片并保存到指定目录
+    
+    Args:
+        zip_ref (zipfile.ZipFile): 已打开的docx文件
+        output_dir (str): 图片输出目录
+    
     Returns:
         dict: 图片ID与输出路径的映射
     """
@@ -33,68 +261,106 @@ def extract_images(docx_path, output_dir):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # 创建一个临时目录来解压docx文件
-    temp_dir = tempfile.mkdtemp()
+    # 先从ZIP中央目录中找出word/media下的图片，没有图片时无需解析关系文件
+    media_infos = []
+    for info in zip_ref.infolist():
+        if not info.filename.startswith('word/media/') or info.is_dir():
+            continue
+        if '/' in info.filename[len('word/media/'):]:
+            continue
+        media_infos.append(info)
+    
+    if not media_infos:
+        return {}
     
+    # 读取关系文件，映射图片ID
+    image_rels = {}
     try:
-        # 将docx解压到临时目录
-        with zipfile.ZipFile(docx_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        # 检查media目录
-        media_dir = os.path.join(temp_dir, 'word', 'media')
-        if not os.path.exists(media_dir):
-            return {}
-        
-        # 读取关系文件，映射图片ID
-        rel_path = os.path.join(temp_dir, 'word', '_rels', 'document.xml.rels')
-        image_rels = {}
-        
-        if os.path.exists(rel_path):
-            try:
-                from lxml import etree
-                tree = etree.parse(rel_path)
-                root = tree.getroot()
-                ns = {'r': 'http://schemas.openxmlformats.org/package/2006/relationships'}
-                
-                for rel in root.xpath('//r:Relationship', namespaces=ns):
-                    rid = rel.get('Id')
-                    target = rel.get('Target')
-                    if 'image' in rel.get('Type', '').lower() and target:
-                        image_rels[rid] = target.split('/')[-1]
-                        
-            except ImportError:
-                # 如果没有lxml库，就使用简单的正则表达式
-                with open(rel_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    pattern = r'<Relationship Id="(rId\d+)" .*?Type=".*?image.*?" .*?Target=".*?/([^/]+)"'
-                    for match in re.finditer(pattern, content):
-                        rid, filename = match.groups()
-                        image_rels[rid] = filename
-        
-        # 复制图片到输出目录并构建映射
-        image_map = {}
-        for filename in os.listdir(media_dir):
-            src_path = os.path.join(media_dir, filename)
-            if os.path.isfile(src_path):
-                dst_path = os.path.join(output_dir, filename)
-                shutil.copy2(src_path, dst_path)
-                
-                # 找到对应的rId
-                for rid, rel_filename in image_rels.items():
-                    if rel_filename == filename:
-                        image_map[rid] = os.path.join('images', filename)
-                        break
-                else:
-                    # 如果在关系文件中找不到，就使用文件名作为键
-                    image_map[filename] = os.path.join('images', filename)
-        
-        return image_map
+        rel_bytes = zip_ref.read('word/_rels/document.xml.rels')
+    except KeyError:
+        rel_bytes = None
+    
+    if rel_bytes is not None:
+        try:
+            root = etree.fromstring(rel_bytes, parser=_RELS_PARSER)
+            
+            # Relationship都是根元素的直接子元素，无需全树搜索
+            for rel in root.iterchildren(_REL_TAG):
+                rid = rel.get('Id')
+                target = rel.get('Target')
+                if 'image' in rel.get('Type', '').lower() and target:
+                    image_rels[rid] = target.split('/')[-1]
+                    
+        except etree.XMLSyntaxError:
+            # 关系文件格式有误时，退回到正则表达式匹配
+            for match in _REL_RE.finditer(rel_bytes):
+                rid, filename = match.groups()
+                image_rels[rid.decode('utf-8')] = filename.decode('utf-8')
+    
+    # 文件名到rId的反向映射(同一图片被多次引用时保留第一个rId)
+    rel_ids = {}
+    for rid, filename in image_rels.items():
+        rel_ids.setdefault(filename, rid)
+    
+    # 将图片直接写入输出目录并构建映射
+    image_map = {}
+    for info in media_infos:
+        filename = info.filename[len('word/media/'):]
+        dst_path = os.path.join(output_dir, filename)
+        with zip_ref.open(info) as src, open(dst_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 64 * 1024)
         
-    finally:
-        # 清理临时目录
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        # 找到对应的rId，如果在关系文件中找不到，就使用文件名作为键
+        image_map[rel_ids.get(filename, filename)] = os.path.join('images', filename)
+    
+    return image_map
+
+def write_paragraph(buf, p, pPr, text, heading_level, is_list_style, image_map):
+    """
+    将单个段落转换为markdown并写入缓冲区
+    
+    Args:
+        buf (io.StringIO): markdown输出缓冲区
+        p (etree._Element): w:p元素
+        pPr (etree._Element): 段落属性w:pPr元素，没有时为None
+        text (str): 去除首尾空白的段落文本
+        heading_level (int): 标题级别，非标题为0
+        is_list_style (bool): 段落样式是否为列表样式
+        image_map (dict): 图片ID与输出路径的映射
+    """
+    if not text:
+        buf.write("\n")
+        return
+    
+    # 处理标题
+    if heading_level > 0:
+        buf.write(f"{'#' * heading_level} {text}\n\n")
+        return
+    
+    # 检查段落属性来确定是否为列表
+    is_numbered = False
+    numPr = pPr.find(W_NUMPR) if pPr is not None else None
+    numId = numPr.find(W_NUMID) if numPr is not None else None
+    if numId is not None:
+        try:
+            num_id = int(numId.get(W_VAL))
+        except (TypeError, ValueError):
+            num_id = 0
+        # 默认认为是有序列表，样式为列表样式时作为无序列表
+        is_numbered = num_id != 0
+    
+    # 处理列表
+    if is_numbered and is_list_style:
+        buf.write(f"* {text}\n")
+    elif is_numbered:
+        buf.write(f"1. {text}\n")  # Markdown会自动处理编号
+    else:
+        # 添加段落文本，段落中有图片时在其后添加图片引用(整个段落只查询一次)
+        buf.write(text)
+        buf.write("\n")
+        for rid in _BLIP_EMBED_XPATH(p):
+            if rid in image_map:
+                buf.write(f"![图片]({image_map[rid]})\n")
 
 def docx_to_markdown(input_path, output_path=None):
     """
@@ -123,119 +389,59 @@ def docx_to_markdown(input_path, output_path=None):
         os.makedirs(img_dir)
     
     try:
-        # 提取图片
-        image_map = extract_images(input_path, img_dir)
-        
-        # 加载文档
-        doc = Document(input_path)
-        
-        # 准备markdown内容
-        markdown_content = []
-        
-        # 处理文档标题（如果有）
-        if len(doc.paragraphs) > 0 and doc.paragraphs[0].style.name.startswith('Title'):
-            title_text = doc.paragraphs[0].text.strip()
-            if title_text:
-                markdown_content.append(f"# {title_text}\n")
-        
-        # 处理段落
-        for para in doc.paragraphs:
-            text = para.text.strip()
-            if not text:
-                markdown_content.append("")
-                continue
-            
-            # 处理标题
-            style_name = para.style.name.lower()
-            if 'heading' in style_name:
-                heading_level = 0
-                if '1' in style_name:
-                    heading_level = 1
-                elif '2' in style_name:
-                    heading_level = 2
-                elif '3' in style_name:
-                    heading_level = 3
-                elif '4' in style_name:
-                    heading_level = 4
-                else:
-                    heading_level = 5  # 默认最多5级标题
-                
-                if heading_level > 0:
-                    markdown_content.append(f"{'#' * heading_level} {text}\n")
-                    continue
+        with zipfile.ZipFile(input_path, 'r') as zip_ref:
+            # 提取图片
+            image_map = extract_images_from_zip(zip_ref, img_dir)
             
-            # 检查段落格式
-            is_bullet = False
-            is_numbered = False
+            # 建立样式查找表，避免对每个段落重复解析样式
+            try:
+                styles_xml = zip_ref.read('word/styles.xml')
+            except KeyError:
+                styles_xml = None
+            style_cache, default_style_info = build_style_cache(styles_xml)
             
-            # 检查段落属性或样式来确定是否为列表
-            if hasattr(para, '_p') and para._p is not None:
-                if para._p.pPr is not None and para._p.pPr.numPr is not None:
-                    if para._p.pPr.numPr.numId is not None:
-                        num_id = para._p.pPr.numPr.numId.val
-                        if num_id != 0:
-                            # 检查是否为有序列表或无序列表
-                            is_numbered = True  # 默认认为是有序列表
-                            is_bullet = 'bullet' in style_name or 'list' in style_name
+            # 准备markdown内容，表格统一放在段落之后
+            buf = io.StringIO()
+            tables_buf = io.StringIO()
             
-            # 处理列表
-            if is_bullet:
-                markdown_content.append(f"* {text}")
-            elif is_numbered:
-                markdown_content.append(f"1. {text}")  # Markdown会自动处理编号
-            else:
-                # 处理段落中的图片
-                img_refs = []
-                for run in para.runs:
-                    for element in run._element.findall('.//a:graphic', {'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'}):
-                        # 尝试找到图片ID
-                        for rid_elem in element.findall('.//a:blip', {'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'}):
-                            rid = rid_elem.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                            if rid and rid in image_map:
-                                img_refs.append(f"![图片]({image_map[rid]})")
-                
-                # 如果段落中有图片，添加图片引用
-                if img_refs:
-                    markdown_content.append(text)
-                    markdown_content.extend(img_refs)
-                else:
-                    markdown_content.append(text)
-        
-        # 处理表格
-        for table in doc.tables:
-            # 添加表格的markdown格式
-            table_markdown = []
-            
-            # 处理表头
-            header_row = []
-            if len(table.rows) > 0:
-                for cell in table.rows[0].cells:
-                    header_row.append(cell.text.strip() or " ")
-                table_markdown.append("| " + " | ".join(header_row) + " |")
-                
-                # 添加分隔行
-                separator = ["---" for _ in range(len(header_row))]
-                table_markdown.append("| " + " | ".join(separator) + " |")
-                
-                # 处理数据行
-                for i, row in enumerate(table.rows):
-                    if i == 0:  # 跳过标题行
+            # 流式解析document.xml，只处理正文中的顶层段落和表格
+            with zip_ref.open('word/document.xml') as xml_file:
+                context = etree.iterparse(xml_file, events=('end',), tag=(W_P, W_TBL), **_XML_PARSER_OPTIONS)
+                is_first_para = True
+                for _, elem in context:
+                    body = elem.getparent()
+                    if body is None or body.tag != W_BODY:
+                        # 表格或其他容器内的段落由所在的顶层元素处理
                         continue
                     
-                    data_row = []
-                    for cell in row.cells:
-                        data_row.append(cell.text.strip() or " ")
+                    if elem.tag == W_TBL:
+                        # 处理表格
+                        table_to_markdown(elem, tables_buf)
+                    else:
+                        pPr = elem.find(W_PPR)
+                        pStyle = pPr.find(W_PSTYLE) if pPr is not None else None
+                        style_id = pStyle.get(W_VAL) if pStyle is not None else None
+                        heading_level, is_list_style, is_title = style_cache.get(style_id, default_style_info)
+                        text = paragraph_text(elem).strip()
+                        
+                        # 处理文档标题（如果有）
+                        if is_first_para and is_title and text:
+                            buf.write(f"# {text}\n\n")
+                        is_first_para = False
+                        
+                        write_paragraph(buf, elem, pPr, text, heading_level, is_list_style, image_map)
                     
-                    table_markdown.append("| " + " | ".join(data_row) + " |")
-                
-                # 添加空行
-                table_markdown.append("")
+                    # 释放已处理的元素，保持内存占用平稳
+                    elem.clear(keep_tail=False)
+                    while elem.getprevious() is not None:
+                        del body[0]
+                del context
             
-            markdown_content.append("\n".join(table_markdown))
+            buf.write(tables_buf.getvalue())
         
         # 写入文件
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(markdown_content))
+            f.write(buf.getvalue())
         
         print(f"已成功将docx文档转换为markdown格式")
         print(f"输出文件: {output_path}")
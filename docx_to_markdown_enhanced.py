@@ -3,145 +3,219 @@
 
 """
 脚本功能: 增强版docx转换为markdown，支持更多格式和样式
-依赖库: python-docx, mammoth, html2markdown
+依赖库: mammoth, lxml
 特点: 使用mammoth库中间转换为HTML，能更准确处理样式和格式
 使用方法: python docx_to_markdown_enhanced.py 输入文件.docx [输出文件.md]
 """
 
 import os
 import sys
-import tempfile
 import shutil
-import re
-import json
-from html import escape as html_escape
-import base64
 try:
     import mammoth
-    import html2markdown
-    from docx import Document
+    from lxml import html as lxml_html
 except ImportError:
-    print("请安装所需依赖：pip install python-docx mammoth html2markdown")
+    print("请安装所需依赖：pip install mammoth lxml")
     sys.exit(1)
 
-def clean_markdown_text(text):
+# HTML标题标签对应的markdown标题前缀
+_HEADING_PREFIX = {f'h{level}': '#' * level for level in range(1, 7)}
+# 列表嵌套时每一级的缩进
+_LIST_INDENT = '    '
+
+class MarkdownEmitter:
     """
-    清理和修复Markdown文本中的常见问题
-    
-    Args:
-        text (str): 原始Markdown文本
+    将mammoth生成的HTML树单次遍历转换为markdown
     
-    Returns:
-        str: 修复后的Markdown文本
+    块级元素之间统一用一个空行分隔，标题前后的空行、连续空行合并等
+    规则在生成时直接保证，不再对结果文本做额外的清理
     """
-    # 修复连续多个空行变成一个空行
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    
-    # 修复表格格式问题
-    lines = text.split('\n')
-    for i in range(len(lines) - 2):
-        # 检查是否为表格头部和分隔行
-        if (lines[i].startswith('|') and 
-            lines[i].endswith('|') and 
-            '---' in lines[i+1]):
-            # 确保分隔行格式正确
-            header_cells = lines[i].count('|') - 1
-            separator = '|' + '|'.join([' --- ' for _ in range(header_cells)]) + '|'
-            lines[i+1] = separator
-    
-    # 修复标题前后的空行
-    fixed_lines = []
-    for i, line in enumerate(lines):
-        if line.startswith('#') and i > 0 and fixed_lines[-1] != '':
-            fixed_lines.append('')  # 标题前添加空行
-            fixed_lines.append(line)
-            if i < len(lines) - 1 and lines[i+1] != '':
-                fixed_lines.append('')  # 标题后添加空行
+    
+    def __init__(self):
+        self.blocks = []
+    
+    def emit_children(self, parent):
+        """处理容器元素的子节点，生成块级内容"""
+        if parent.text and parent.text.strip():
+            self.blocks.append(parent.text.strip())
+        for child in parent:
+            if isinstance(child.tag, str):
+                self.emit_block(child)
+            if child.tail and child.tail.strip():
+                self.blocks.append(child.tail.strip())
+    
+    def emit_block(self, node):
+        """处理单个块级元素"""
+        tag = node.tag
+        if tag in _HEADING_PREFIX:
+            text = self.inline(node).strip()
+            if text:
+                self.blocks.append(f"{_HEADING_PREFIX[tag]} {text}")
+        elif tag == 'p':
+            text = self.inline(node).strip()
+            if text:
+                self.blocks.append(text)
+        elif tag in ('ul', 'ol'):
+            lines = []
+            self.list_lines(node, 0, lines)
+            if lines:
+                self.blocks.append('\n'.join(lines))
+        elif tag == 'pre':
+            self.blocks.append(f"```\n{node.text_content().rstrip()}\n```")
+        elif tag == 'blockquote':
+            inner = MarkdownEmitter()
+            inner.emit_children(node)
+            text = inner.getvalue()
+            if text:
+                self.blocks.append('\n'.join(f"> {line}" if line else '>' for line in text.split('\n')))
+        elif tag == 'table':
+            self.table(node)
+        elif tag in ('img', 'a', 'strong', 'b', 'em', 'i', 'code', 'span', 'sup', 'sub', 'u', 's', 'br'):
+            # 出现在块级位置的行内元素按独立段落处理
+            text = self.inline_node(node).strip()
+            if text:
+                self.blocks.append(text)
         else:
-            fixed_lines.append(line)
+            # div等其他容器
+            self.emit_children(node)
     
-    # 修复列表项目间的空行问题
-    text = '\n'.join(fixed_lines)
+    def inline(self, node):
+        """生成元素内部的行内markdown文本(不含元素自身的tail)"""
+        parts = [node.text or '']
+        for child in node:
+            if isinstance(child.tag, str):
+                parts.append(self.inline_node(child))
+            parts.append(child.tail or '')
+        return ''.join(parts)
     
-    # 修复图片链接
-    text = re.sub(r'!\[(.*?)\]\((?!http)(.*?)\)', r'![\1](images/\2)', text)
+    def inline_node(self, node):
+        """生成单个行内元素的markdown文本"""
+        tag = node.tag
+        if tag == 'img':
+            return f"![{node.get('alt') or '图片'}]({node.get('src', '')})"
+        if tag == 'br':
+            return '  \n'
+        if tag in ('ul', 'ol', 'p', 'table'):
+            # 单元格或列表项中的块级元素按空格连接
+            return ' ' + self.inline(node).strip() + ' '
+        
+        text = self.inline(node)
+        if not text.strip():
+            return text
+        if tag in ('strong', 'b'):
+            return f"**{text}**"
+        if tag in ('em', 'i'):
+            return f"*{text}*"
+        if tag == 'code':
+            return f"`{text}`"
+        if tag in ('s', 'del'):
+            return f"~~{text}~~"
+        if tag == 'a' and node.get('href'):
+            return f"[{text}]({node.get('href')})"
+        return text
     
-    # 移除HTML转义
-    text = text.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+    def list_lines(self, node, depth, lines):
+        """生成列表的各行，嵌套列表按层级缩进"""
+        marker = '* ' if node.tag == 'ul' else '1. '
+        indent = _LIST_INDENT * depth
+        for li in node.iterchildren('li'):
+            parts = [li.text or '']
+            nested = []
+            for child in li:
+                if child.tag in ('ul', 'ol'):
+                    nested.append(child)
+                elif isinstance(child.tag, str):
+                    parts.append(self.inline_node(child))
+                parts.append(child.tail or '')
+            lines.append(f"{indent}{marker}{' '.join(''.join(parts).split())}")
+            for child in nested:
+                self.list_lines(child, depth + 1, lines)
+    
+    def table(self, node):
+        """生成markdown表格，第一行作为表头"""
+        rows = []
+        for tr in node.iter('tr'):
+            cells = [' '.join(self.inline(cell).split()).replace('|', '\\|') or ' '
+                     for cell in tr.iterchildren('th', 'td')]
+            if cells:
+                rows.append(cells)
+        if not rows:
+            return
+        
+        lines = ["| " + " | ".join(rows[0]) + " |",
+                 "| " + " | ".join(["---"] * len(rows[0])) + " |"]
+        lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+        self.blocks.append('\n'.join(lines))
     
-    return text
+    def getvalue(self):
+        """返回生成的markdown文本"""
+        return '\n\n'.join(self.blocks)
 
-def convert_images_to_markdown_links(html_content, image_dir, root_path):
+def html_to_markdown(html):
     """
-    将HTML中的img标签转换为Markdown图片链接，并保存图片
+    将HTML片段转换为markdown
     
     Args:
-        html_content (str): HTML内容
-        image_dir (str): 图片保存目录
-        root_path (str): 文档根目录
+        html (str): mammoth生成的HTML内容
     
     Returns:
-        str: 处理后的HTML内容
+        str: markdown文本
     """
-    if not os.path.exists(image_dir):
-        os.makedirs(image_dir)
-    
-    # 处理base64编码的图片
-    img_pattern = re.compile(r'<img[^>]*src="data:image/([^;]+);base64,([^"]+)"[^>]*>')
-    img_count = 0
-    
-    def replace_image(match):
-        nonlocal img_count
-        img_count += 1
-        img_format = match.group(1)
-        img_data = match.group(2)
+    if not html.strip():
+        return ''
+    emitter = MarkdownEmitter()
+    emitter.emit_children(lxml_html.fragment_fromstring(html, create_parent='div'))
+    return emitter.getvalue() + '\n'
+
+class ImageWriter:
+    """mammoth的图片转换回调：把图片直接写入图片目录，HTML中只引用相对路径"""
+    
+    def __init__(self, image_dir):
+        self.image_dir = image_dir
+        self.count = 0
+    
+    def __call__(self, image):
+        if not os.path.exists(self.image_dir):
+            os.makedirs(self.image_dir)
         
-        # 保存图片
-        filename = f"image_{img_count}.{img_format}"
-        img_path = os.path.join(image_dir, filename)
-        rel_path = os.path.join('images', filename)
+        self.count += 1
+        img_format = image.content_type.split('/')[-1]
+        filename = f"image_{self.count}.{img_format}"
         
-        with open(img_path, 'wb') as f:
-            f.write(base64.b64decode(img_data))
+        with image.open() as src, open(os.path.join(self.image_dir, filename), 'wb') as dst:
+            shutil.copyfileobj(src, dst, 64 * 1024)
         
-        # 替换为Markdown图片语法
-        return f'![图片]({rel_path})'
-    
-    html_with_images = img_pattern.sub(replace_image, html_content)
-    return html_with_images
+        return {"src": os.path.join('images', filename)}
+
+# mammoth使用的自定义样式映射，以及序列化后的样式映射字符串(导入时只构建一次)
+_STYLE_MAP = {
+    "p[style-name='Heading 1']": "h1",
+    "p[style-name='Heading 2']": "h2",
+    "p[style-name='Heading 3']": "h3",
+    "p[style-name='Heading 4']": "h4",
+    "p[style-name='Heading 5']": "h5",
+    "p[style-name='Title']": "h1.title",
+    "p[style-name='Subtitle']": "h2.subtitle",
+    "p[style-name='Quote']": "blockquote",
+    "p[style-name='Intense Quote']": "blockquote.intense",
+    "r[style-name='Strong']": "strong",
+    "r[style-name='Emphasis']": "em",
+    "p[style-name='List Paragraph']": "p.list",
+    "table": "table.docx-table",
+    "p[style-name='Caption']": "p.caption",
+    "p[style-name='TOC Heading']": "h1.toc-heading",
+    "p[style-name='TOC 1']": "p.toc-1",
+    "p[style-name='TOC 2']": "p.toc-2",
+    "p[style-name='TOC 3']": "p.toc-3",
+    "r[style-name='Hyperlink']": "a",
+    "p[style-name='Code']": "pre.code",
+    "r[style-name='Code Char']": "code"
+}
+_STYLE_MAP_STR = "\n".join(f"{key} => {value}" for key, value in _STYLE_MAP.items())
 
 def create_custom_style_map():
     """创建自定义的样式映射"""
-    return {
-        "p[style-name='Heading 1']": "h1",
-        "p[style-name='Heading 2']": "h2",
-        "p[style-name='Heading 3']": "h3",
-        "p[style-name='Heading 4']": "h4",
-        "p[style-name='Heading 5']": "h5",
-        "p[style-name='Title']": "h1.title",
-        "p[style-name='Subtitle']": "h2.subtitle",
-        "p[style-name='Quote']": "blockquote",
-        "p[style-name='Intense Quote']": "blockquote.intense",
-        "r[style-name='Strong']": "strong",
-        "r[style-name='Emphasis']": "em",
-        "p[style-name='List Paragraph']": "p.list",
-        "table": "table.docx-table",
-        "p[style-name='Caption']": "p.caption",
-        "p[style-name='TOC Heading']": "h1.toc-heading",
-        "p[style-name='TOC 1']": "p.toc-1",
-        "p[style-name='TOC 2']": "p.toc-2",
-        "p[style-name='TOC 3']": "p.toc-3",
-        "r[style-name='Hyperlink']": "a",
-        "p[style-name='Code']": "pre.code",
-        "r[style-name='Code Char']": "code"
-    }
-
-def base64_bytes_image(image):
-    """从mammoth图片对象中获取base64编码的数据"""
-    with image.open() as image_bytes:
-        # 大多数情况下是bytes对象，需要读取
-        image_data = image_bytes.read() if hasattr(image_bytes, 'read') else image_bytes
-        return base64.b64encode(image_data).decode('ascii')
+    return dict(_STYLE_MAP)
 
 def docx_to_markdown(input_path, output_path=None):
     """
@@ -168,21 +242,15 @@ def docx_to_markdown(input_path, output_path=None):
     img_dir = os.path.join(os.path.dirname(output_path) or '.', 'images')
     
     try:
-        # 创建自定义样式映射
-        style_map = create_custom_style_map()
-        style_map_str = "\n".join([f"{key} => {value}" for key, value in style_map.items()])
-        
         # 使用mammoth进行转换
         with open(input_path, "rb") as docx_file:
             # 转换为HTML
             result = mammoth.convert_to_html(
                 docx_file,
-                style_map=style_map_str,
+                style_map=_STYLE_MAP_STR,
                 include_embedded_style_map=True,
                 ignore_empty_paragraphs=True,
-                convert_image=mammoth.images.img_element(lambda image: {
-                    "src": f"data:{image.content_type};base64,{base64_bytes_image(image)}"
-                })
+                convert_image=mammoth.images.img_element(ImageWriter(img_dir))
             )
             
             html = result.value
@@ -193,14 +261,8 @@ def docx_to_markdown(input_path, output_path=None):
                 for message in result.messages:
                     print(f"- {message}")
         
-        # 处理HTML中的图片
-        html = convert_images_to_markdown_links(html, img_dir, os.path.dirname(output_path) or '.')
-        
-        # 将处理后的HTML转换为Markdown
-        markdown_text = html2markdown.convert(html)
-        
-        # 清理和修复Markdown文本
-        markdown_text = clean_markdown_text(markdown_text)
+        # 单次遍历HTML树直接生成Markdown(图片已在转换时写入图片目录)
+        markdown_text = html_to_markdown(html)
         
         # 写入文件
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -3,31 +3,83 @@
 
 """
 脚本功能: 将Markdown文档转换为Word文档(.docx)格式
-依赖库: markdown, python-docx, beautifulsoup4, requests
+依赖库: markdown, python-docx, lxml, requests
 使用方法: python markdown_to_docx.py 输入文件.md [输出文件.docx]
 """
 
+import io
 import os
 import sys
 import re
 import shutil
-import tempfile
 from pathlib import Path
 import base64
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 try:
     import markdown
+    from lxml import etree
+    from lxml import html as lxml_html
     from docx import Document
     from docx.shared import Pt, Inches, RGBColor
     from docx.enum.text import WD_ALIGN_PARAGRAPH
     from docx.oxml.ns import qn
+    from docx.oxml import OxmlElement
 except ImportError:
-    print("请安装所需依赖：pip install Markdown python-docx beautifulsoup4 requests")
+    print("请安装所需依赖：pip install Markdown python-docx lxml requests")
     sys.exit(1)
 
+# 可选依赖：安装cachecontrol后，网络图片按ETag/Last-Modified缓存到本地，重复运行时使用条件请求
+try:
+    from cachecontrol import CacheControlAdapter
+    from cachecontrol.caches.file_cache import FileCache
+except ImportError:
+    CacheControlAdapter = None
+
+# 同时下载网络图片的最大线程数(也是每个主机的连接池大小上限)
+MAX_DOWNLOAD_WORKERS = 8
+# 单次请求的超时时间(秒)
+DOWNLOAD_TIMEOUT = 30
+
+# 网络图片的HTTP缓存目录(仅在安装了cachecontrol时使用)
+HTTP_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'md2docx')
+
+# 模块级共享会话：复用TCP/TLS连接，失败时按指数退避重试
+_SESSION = requests.Session()
+_adapter_options = {
+    'pool_connections': 16,
+    'pool_maxsize': 16,
+    'max_retries': Retry(total=3, backoff_factor=0.3),
+}
+_adapter = None
+if CacheControlAdapter is not None:
+    try:
+        _adapter = CacheControlAdapter(cache=FileCache(HTTP_CACHE_DIR), **_adapter_options)
+    except Exception as e:
+        # 缓存不可用(如缺少filelock、缓存目录无法创建)时不影响转换，只是不缓存网络图片
+        print(f"警告: 无法使用HTTP缓存目录 {HTTP_CACHE_DIR}({e})，网络图片将不做缓存")
+if _adapter is None:
+    _adapter = HTTPAdapter(**_adapter_options)
+_SESSION.mount('http://', _adapter)
+_SESSION.mount('https://', _adapter)
+
+# Markdown图片语法 ![alt](url)
+_MD_IMG_RE = re.compile(r'!\[(.*?)\]\((.*?)\)')
+# 单元格文本中需要转换为w:tab/w:br元素的制表符和换行符
+_RUN_BREAK_RE = re.compile(r'([\t\n\r])')
+
+# 直接写入表格单元格时用到的标签和属性
+W_P = qn('w:p')
+XML_SPACE = qn('xml:space')
+
+# HTML中需要转换为Word元素的标签
+_HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+_BLOCK_TAGS = frozenset(_HEADING_TAGS + ('p', 'ul', 'ol', 'pre', 'blockquote', 'img', 'table'))
+
 def extract_images_from_markdown(md_text, base_dir):
     """
     从Markdown文本中提取图片链接，下载图片并返回替换后的文本和图片映射
@@ -39,8 +91,9 @@ def extract_images_from_markdown(md_text, base_dir):
     Returns:
         tuple: (替换后的Markdown文本, 图片映射字典)
     """
-    image_pattern = r'!\[(.*?)\]\((.*?)\)'
     images = {}
+    # 图片来源(本地路径或URL)到文件名的映射，同一图片多次引用时只下载或复制一次
+    seen = {}
     img_counter = 0
     
     def replace_image(match):
@@ -49,6 +102,9 @@ def extract_images_from_markdown(md_text, base_dir):
         alt_text = match.group(1)
         img_url = match.group(2)
         
+        if img_url in seen:
+            return f"![{alt_text}]({seen[img_url]})"
+        
         # 处理本地图片
         if not img_url.startswith(('http://', 'https://', 'data:')):
             if os.path.isabs(img_url):
@@ -60,6 +116,7 @@ def extract_images_from_markdown(md_text, base_dir):
             if os.path.exists(img_path):
                 img_filename = f"image_{img_counter}{os.path.splitext(img_path)[1]}"
                 images[img_filename] = (img_path, alt_text)
+                seen[img_url] = img_filename
                 return f"![{alt_text}]({img_filename})"
         
         # 处理网络图片或已经替换的图片
@@ -73,6 +130,7 @@ def extract_images_from_markdown(md_text, base_dir):
                         img_filename = f"image_{img_counter}{ext}"
                 
                 images[img_filename] = (img_url, alt_text)
+                seen[img_url] = img_filename
                 return f"![{alt_text}]({img_filename})"
             except Exception as e:
                 print(f"警告：无法处理图片URL：{img_url}, 错误：{str(e)}")
@@ -81,55 +139,120 @@ def extract_images_from_markdown(md_text, base_dir):
         return match.group(0)
     
     # 替换并提取图片
-    processed_text = re.sub(image_pattern, replace_image, md_text)
+    processed_text = _MD_IMG_RE.sub(replace_image, md_text)
     return processed_text, images
 
-def download_images(images, output_dir):
+def _download_one(url):
     """
-    下载或复制图片到临时目录
+    通过共享会话把单张网络图片流式下载到内存
     
     Args:
-        images (dict): 图片映射字典
-        output_dir (str): 图片保存目录
+        url (str): 图片URL
     
     Returns:
-        dict: 更新后的图片映射，包含本地路径
+        io.BytesIO: 图片数据，下载失败时返回None
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    with _SESSION.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code != 200:
+            print(f"警告：无法下载图片 {url}, 状态码：{response.status_code}")
+            return None
+        
+        raw = response.raw
+        raw.decode_content = True
+        buf = io.BytesIO()
+        shutil.copyfileobj(raw, buf, 64 * 1024)
+        
+        # 校验实际接收的字节数(解压前)与Content-Length是否一致
+        expected = response.headers.get('Content-Length')
+        if expected is not None and expected.isdigit() and raw.tell() != int(expected):
+            print(f"警告：图片下载不完整 {url}, 期望 {expected} 字节，实际 {raw.tell()} 字节")
+            return None
+    
+    buf.seek(0)
+    return buf
+
+def download_images(images):
+    """
+    准备插入文档的图片数据
+    
+    网络图片通过共享会话并发下载到内存，最多同时进行MAX_DOWNLOAD_WORKERS个请求；
+    本地图片直接使用原路径，不再复制
     
+    Args:
+        images (dict): 图片映射字典
+    
+    Returns:
+        dict: 更新后的图片映射，值为(本地路径或内存中的图片数据, 说明文字)
+    """
     image_paths = {}
+    remote_images = []
     for filename, (url_or_path, alt) in images.items():
-        dest_path = os.path.join(output_dir, filename)
-        
-        try:
-            if url_or_path.startswith(('http://', 'https://')):
-                # 下载网络图片
-                response = requests.get(url_or_path, stream=True)
-                if response.status_code == 200:
-                    with open(dest_path, 'wb') as f:
-                        response.raw.decode_content = True
-                        shutil.copyfileobj(response.raw, f)
-                    image_paths[filename] = (dest_path, alt)
-                else:
-                    print(f"警告：无法下载图片 {url_or_path}, 状态码：{response.status_code}")
-                    continue
-            else:
-                # 复制本地图片
-                shutil.copy2(url_or_path, dest_path)
-                image_paths[filename] = (dest_path, alt)
-        except Exception as e:
-            print(f"警告：处理图片失败 {url_or_path}, 错误：{str(e)}")
+        if url_or_path.startswith(('http://', 'https://')):
+            remote_images.append((filename, url_or_path, alt))
+        else:
+            image_paths[filename] = (url_or_path, alt)
+    
+    if not remote_images:
+        return image_paths
+    
+    # 并发下载网络图片
+    with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_WORKERS, len(remote_images))) as executor:
+        futures = {
+            executor.submit(_download_one, url): (filename, url, alt)
+            for filename, url, alt in remote_images
+        }
+        for future in as_completed(futures):
+            filename, url, alt = futures[future]
+            try:
+                data = future.result()
+                if data is not None:
+                    image_paths[filename] = (data, alt)
+            except Exception as e:
+                print(f"警告：处理图片失败 {url}, 错误：{str(e)}")
     
     return image_paths
 
+def set_cell_text(tc, text):
+    """
+    在表格单元格(w:tc)的段落中追加一个包含文本的run
+    
+    与python-docx的cell.text一致，制表符转换为w:tab，换行符转换为w:br
+    
+    Args:
+        tc: 新建表格中的w:tc元素(已包含一个空段落)
+        text (str): 单元格文本
+    """
+    p = tc.find(W_P)
+    if p is None:
+        p = OxmlElement('w:p')
+        tc.append(p)
+    
+    r = OxmlElement('w:r')
+    for piece in _RUN_BREAK_RE.split(text):
+        if not piece:
+            continue
+        if piece == '\t':
+            r.append(OxmlElement('w:tab'))
+        elif piece in '\n\r':
+            r.append(OxmlElement('w:br'))
+        else:
+            t = OxmlElement('w:t')
+            t.text = piece
+            if piece != piece.strip():
+                # 保留首尾空白
+                t.set(XML_SPACE, 'preserve')
+            r.append(t)
+    p.append(r)
+
 def convert_html_to_docx(html, image_paths, output_path):
     """
     将HTML转换为DOCX格式
     
+    使用lxml解析HTML，并按文档顺序单次遍历所有元素生成Word内容
+    
     Args:
         html (str): HTML内容
-        image_paths (dict): 图片路径字典
+        image_paths (dict): 图片字典，值为(本地路径或内存中的图片数据, 说明文字)
         output_path (str): 输出DOCX文件路径
     """
     # 创建新文档
@@ -142,103 +265,122 @@ def convert_html_to_docx(html, image_paths, output_path):
     font.size = Pt(12)
     
     # 解析HTML
-    soup = BeautifulSoup(html, 'html.parser')
+    root = lxml_html.fragment_fromstring(html, create_parent='div')
     
-    # 处理元素
-    for element in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'pre', 'blockquote', 'img', 'table']):
-        if element.name.startswith('h') and len(element.name) == 2:
+    add_paragraph = doc.add_paragraph
+    add_heading = doc.add_heading
+    add_picture = doc.add_picture
+    
+    # 处理元素(按文档顺序遍历，嵌套元素同样会被处理)
+    for _, element in etree.iterwalk(root, events=('start',)):
+        tag = element.tag
+        if tag not in _BLOCK_TAGS:
+            continue
+        
+        if tag in _HEADING_TAGS:
             # 处理标题
-            level = int(element.name[1])
-            heading = doc.add_heading(level=level)
-            heading.add_run(element.get_text())
+            level = int(tag[1])
+            heading = add_heading(level=level)
+            heading.add_run(element.text_content())
         
-        elif element.name == 'p':
+        elif tag == 'p':
             # 处理段落
-            p = doc.add_paragraph()
+            p = add_paragraph()
             
-            # 遍历段落内容
-            for content in element.contents:
-                if content.name == 'strong' or content.name == 'b':
-                    p.add_run(content.get_text()).bold = True
-                elif content.name == 'em' or content.name == 'i':
-                    p.add_run(content.get_text()).italic = True
-                elif content.name == 'a':
-                    run = p.add_run(content.get_text())
+            # 遍历段落内容：开头文本、子元素及其后的文本
+            if element.text:
+                p.add_run(element.text)
+            for content in element:
+                name = content.tag
+                if name == 'strong' or name == 'b':
+                    p.add_run(content.text_content()).bold = True
+                elif name == 'em' or name == 'i':
+                    p.add_run(content.text_content()).italic = True
+                elif name == 'a':
+                    run = p.add_run(content.text_content())
                     run.font.color.rgb = RGBColor(0, 0, 255)
                     run.font.underline = True
-                elif content.name == 'code':
-                    run = p.add_run(content.get_text())
+                elif name == 'code':
+                    run = p.add_run(content.text_content())
                     run.font.name = 'Courier New'
-                elif content.name == 'img':
+                elif name == 'img':
                     # 图片会单独处理
                     pass
-                else:
-                    # 处理纯文本
-                    if isinstance(content, str):
-                        p.add_run(content)
-                    else:
-                        p.add_run(content.get_text())
+                elif isinstance(name, str):
+                    p.add_run(content.text_content())
+                
+                # 处理子元素后的纯文本
+                if content.tail:
+                    p.add_run(content.tail)
         
-        elif element.name == 'img':
+        elif tag == 'img':
             # 处理图片
             src = element.get('src')
             alt = element.get('alt', '')
             
             if src in image_paths:
-                img_path, _ = image_paths[src]
+                img_source, _ = image_paths[src]
                 try:
-                    doc.add_picture(img_path, width=Inches(6))  # 默认宽度
+                    # 同一张图片可能被多次插入，内存中的数据每次从头读取
+                    if hasattr(img_source, 'seek'):
+                        img_source.seek(0)
+                    add_picture(img_source, width=Inches(6))  # 默认宽度
                     # 添加图片说明
                     if alt:
-                        caption = doc.add_paragraph(alt)
+                        caption = add_paragraph(alt)
                         caption.alignment = WD_ALIGN_PARAGRAPH.CENTER
                         caption.style = 'Caption'
                 except Exception as e:
                     print(f"警告：无法插入图片 {src}, 错误：{str(e)}")
         
-        elif element.name == 'ul' or element.name == 'ol':
+        elif tag == 'ul' or tag == 'ol':
+            # 计算列表的嵌套级别(连续的列表祖先数)，同一列表的各项级别相同
+            level = 1
+            parent = element.getparent()
+            while parent is not None and parent.tag in ('ul', 'ol'):
+                level += 1
+                parent = parent.getparent()
+            
             # 处理列表
-            for li in element.find_all('li', recursive=False):
-                level = 0
-                parent = li.parent
-                while parent and parent.name in ['ul', 'ol']:
-                    level += 1
-                    parent = parent.parent
-                
+            list_style = 'List Bullet' if tag == 'ul' else 'List Number'
+            for li in element.iterchildren('li'):
                 # 设置缩进级别
-                p = doc.add_paragraph(style='List Bullet' if element.name == 'ul' else 'List Number')
+                p = add_paragraph(style=list_style)
                 p.paragraph_format.left_indent = Pt(18 * level)
-                p.add_run(li.get_text())
+                p.add_run(li.text_content())
         
-        elif element.name == 'pre':
+        elif tag == 'pre':
             # 处理代码块
-            code = element.get_text()
-            p = doc.add_paragraph(style='No Spacing')
+            code = element.text_content()
+            p = add_paragraph(style='No Spacing')
             run = p.add_run(code)
             run.font.name = 'Courier New'
             run.font.size = Pt(10)
         
-        elif element.name == 'blockquote':
+        elif tag == 'blockquote':
             # 处理引用
-            p = doc.add_paragraph(style='Intense Quote')
-            p.add_run(element.get_text())
+            p = add_paragraph(style='Intense Quote')
+            p.add_run(element.text_content())
         
-        elif element.name == 'table':
-            # 处理表格
-            rows = len(element.find_all('tr'))
-            if rows > 0:
-                first_row = element.find('tr')
-                cols = len(first_row.find_all(['th', 'td']))
+        elif tag == 'table':
+            # 处理表格(只在表格子树内遍历)
+            rows = list(element.iter('tr'))
+            if rows:
+                cols = sum(1 for _ in rows[0].iter('th', 'td'))
                 
-                if cols > 0 and rows > 0:
-                    table = doc.add_table(rows=rows, cols=cols)
+                if cols > 0:
+                    table = doc.add_table(rows=len(rows), cols=cols)
                     table.style = 'Table Grid'
                     
-                    for i, row in enumerate(element.find_all('tr')):
-                        cells = row.find_all(['th', 'td'])
-                        for j, cell in enumerate(cells):
-                            if j < cols:  # 防止表格不规则
-                                table.cell(i, j).text = cell.get_text()
+                    # 直接向单元格XML写入文本，不经过python-docx的cell.text逐个重建段落
+                    for tr, row in zip(table._tbl.tr_lst, rows):
+                        tcs = tr.tc_lst
+                        for j, cell in enumerate(row.iter('th', 'td')):
+                            if j >= cols:  # 防止表格不规则
+                                break
+                            text = cell.text_content()
+                            if text:
+                                set_cell_text(tcs[j], text)
     
     # 保存文档
     doc.save(output_path)
@@ -273,34 +415,26 @@ def markdown_to_docx(input_path, output_path=None):
         base_dir = os.path.dirname(os.path.abspath(input_path))
         processed_md, images = extract_images_from_markdown(md_text, base_dir)
         
-        # 创建临时目录存放图片
-        temp_dir = tempfile.mkdtemp()
-        try:
-            # 下载或复制图片
-            img_dir = os.path.join(temp_dir, 'images')
-            image_paths = download_images(images, img_dir)
-            
-            # 转换Markdown为HTML
-            html = markdown.markdown(
-                processed_md,
-                extensions=[
-                    'markdown.extensions.tables',
-                    'markdown.extensions.fenced_code',
-                    'markdown.extensions.nl2br',
-                    'markdown.extensions.sane_lists'
-                ]
-            )
-            
-            # 将HTML转换为DOCX
-            convert_html_to_docx(html, image_paths, output_path)
-            
-            print(f"已成功将Markdown文档转换为Word格式")
-            print(f"输出文件: {output_path}")
-            return output_path
-            
-        finally:
-            # 清理临时目录
-            shutil.rmtree(temp_dir)
+        # 转换Markdown为HTML
+        html = markdown.markdown(
+            processed_md,
+            extensions=[
+                'markdown.extensions.tables',
+                'markdown.extensions.fenced_code',
+                'markdown.extensions.nl2br',
+                'markdown.extensions.sane_lists'
+            ]
+        )
+        
+        # 下载网络图片到内存(本地图片直接使用原路径)
+        image_paths = download_images(images)
+        
+        # 将HTML转换为DOCX
+        convert_html_to_docx(html, image_paths, output_path)
+        
+        print(f"已成功将Markdown文档转换为Word格式")
+        print(f"输出文件: {output_path}")
+        return output_path
             
     except Exception as e:
         print(f"转换过程中出错: {str(e)}")
@@ -9,16 +9,126 @@
 
 import os
 import cv2
+import queue
+import shelve
+import hashlib
 import argparse
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from pathlib import Path
 from paddleocr import PaddleOCR, draw_ocr
 
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# 默认的高性能推理参数(GPU/CPU)
+HIGH_PERFORMANCE_GPU_OPTIONS = {'use_tensorrt': True, 'precision': 'fp16'}
+HIGH_PERFORMANCE_CPU_OPTIONS = {'enable_mkldnn': True}
+
+# 可视化结果时使用的中文字体，按顺序选择第一个存在的字体
+FONT_PATHS = (
+    '/System/Library/Fonts/PingFang.ttc',  # macOS系统中文字体
+    '/System/Library/Fonts/STHeiti Light.ttc',  # macOS另一个中文字体
+    '/System/Library/Fonts/Hiragino Sans GB.ttc',  # macOS另一个中文字体
+    '/Library/Fonts/Arial Unicode.ttf',  # 通用Unicode字体
+    './fonts/simfang.ttf'  # 回退到原始路径
+)
+
+# 批量处理流水线中相邻阶段之间缓冲队列的容量
+PIPELINE_QUEUE_SIZE = 32
+# 批量处理时保存识别结果(绘制可视化图片、写文件)的默认线程数
+SAVE_WORKERS = min(4, os.cpu_count() or 1)
+# 流水线结束标记
+_STOP = object()
+
+def list_image_files(dir_path, extensions=IMAGE_EXTENSIONS):
+    """
+    获取目录中所有支持的图片文件
+    
+    参数:
+        dir_path: 图片目录路径
+        extensions: 支持的图片扩展名元组
+        
+    返回:
+        image_files: 图片文件路径列表
+    """
+    if not os.path.isdir(dir_path):
+        raise NotADirectoryError(f"目录不存在: {dir_path}")
+    
+    # 单次扫描目录，文件类型直接取自目录项，不必对每个文件再调用stat
+    extensions = tuple(ext.lower() for ext in extensions)
+    image_files = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.name.lower().endswith(extensions) and entry.is_file():
+                image_files.append(entry.path)
+    return image_files
+
+def read_image(img_path):
+    """
+    读取图片为BGR格式的numpy数组(支持中文路径)
+    
+    参数:
+        img_path: 图片路径
+        
+    返回:
+        img: 图片数组
+    """
+    img = cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"无法读取图片: {img_path}")
+    return img
+
+def find_font_path(font_paths=FONT_PATHS):
+    """
+    查找可用于绘制识别结果的字体
+    
+    参数:
+        font_paths: 候选字体路径，按优先级排列
+        
+    返回:
+        font_path: 第一个存在的字体路径，都不存在时返回None
+    """
+    for font_path in font_paths:
+        if os.path.exists(font_path):
+            return font_path
+    return None
+
+def image_key(data):
+    """
+    计算图片内容的哈希值，用作识别结果缓存的键
+    
+    参数:
+        data: 图片文件的原始字节(bytes或一维uint8数组)，或解码后的图片数组
+        
+    返回:
+        key: 十六进制哈希字符串
+    """
+    if isinstance(data, np.ndarray) and data.ndim > 1:
+        # 解码后的数组需同时考虑形状，避免像素字节相同但尺寸不同的图片冲突
+        digest = hashlib.blake2b(str(data.shape).encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(data))
+        return digest.hexdigest()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def pil_to_bgr(pil_img):
+    """
+    将PIL图片转换为BGR格式的numpy数组(OpenCV/PaddleOCR使用的通道顺序)
+    
+    参数:
+        pil_img: PIL.Image图片对象
+        
+    返回:
+        img: 连续存储的BGR图片数组
+    """
+    return np.ascontiguousarray(np.asarray(pil_img.convert('RGB'))[:, :, ::-1])
+
 class OCRProcessor:
     """PaddleOCR图像文字识别处理器"""
     
-    def __init__(self, use_gpu=False, lang='ch', use_angle_cls=True):
+    def __init__(self, use_gpu=False, lang='ch', use_angle_cls=True, gpu_id=0, batch_size=None,
+                 high_performance=True, low_memory=None, cache_path=None, **ocr_kwargs):
         """
         初始化OCR处理器
         
@@ -26,10 +136,88 @@ class OCRProcessor:
             use_gpu: 是否使用GPU加速
             lang: 识别语言，如'ch'(中文),'en'(英文),'jp'(日语)等
             use_angle_cls: 是否使用方向分类器
+            gpu_id: 使用的GPU编号(仅在use_gpu为True时有效)
+            batch_size: 文本行识别的批大小(rec_batch_num)，默认为None(使用PaddleOCR默认值)
+            high_performance: 是否默认开启高性能推理参数(GPU: TensorRT + FP16，CPU: MKL-DNN + 全部CPU线程)，
+                              ocr_kwargs中显式给出的参数优先；开启后初始化失败时自动回退到普通FP32推理
+            low_memory: 是否以低内存模式运行，即每次只识别一个文本行(rec_batch_num=1)，默认仅在CPU模式下开启。
+                        CPU上文本行识别并不会在批内并行，较大的批只会让推理内存池常驻更多内存，
+                        逐行识别的精度相同、吞吐基本不变；显式指定batch_size或rec_batch_num时以其为准
+            cache_path: 识别结果缓存文件路径，默认为None(只在内存中缓存)。
+                        结果按图片内容哈希缓存，重复出现的图片(如logo、页眉、印章)不再重复识别
+            ocr_kwargs: 透传给PaddleOCR的其他推理参数，如precision、use_tensorrt、
+                        enable_mkldnn、cpu_threads、det_limit_side_len等
         """
-        self.ocr = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang, use_gpu=use_gpu)
+        if batch_size:
+            ocr_kwargs.setdefault('rec_batch_num', batch_size)
+        if low_memory is None:
+            low_memory = not use_gpu
+        if low_memory:
+            ocr_kwargs.setdefault('rec_batch_num', 1)
+        
+        # 未显式指定的高性能推理参数
+        accel_kwargs = {}
+        if high_performance:
+            defaults = HIGH_PERFORMANCE_GPU_OPTIONS if use_gpu else dict(HIGH_PERFORMANCE_CPU_OPTIONS, cpu_threads=os.cpu_count() or 1)
+            accel_kwargs = {key: value for key, value in defaults.items() if key not in ocr_kwargs}
+        
+        try:
+            self.ocr = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang, use_gpu=use_gpu, gpu_id=gpu_id,
+                                 **accel_kwargs, **ocr_kwargs)
+        except Exception as e:
+            if not accel_kwargs:
+                raise
+            # 当前环境不支持TensorRT/FP16或MKL-DNN时，回退到普通推理
+            print(f"警告: 高性能推理参数初始化失败({e})，回退到FP32推理")
+            self.ocr = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang, use_gpu=use_gpu, gpu_id=gpu_id, **ocr_kwargs)
         self.lang = lang
         self.use_gpu = use_gpu
+        self._cache = shelve.open(cache_path) if cache_path else {}
+        # 可视化使用的字体在初始化时确定一次，不必每张图片都重新查找
+        self._font_path = find_font_path()
+    
+    def close(self):
+        """将识别结果缓存写回缓存文件(仅在指定cache_path时需要)"""
+        if isinstance(self._cache, shelve.Shelf):
+            self._cache.close()
+            self._cache = {}
+    
+    def cached_result(self, key):
+        """
+        查询缓存的识别结果
+        
+        参数:
+            key: image_key()计算的图片哈希
+            
+        返回:
+            result: 缓存的OCR识别结果，未缓存时返回None
+        """
+        return self._cache.get(key)
+    
+    def _recognize_cached(self, key, img):
+        """识别图片，内容相同的图片直接返回缓存的结果"""
+        result = self._cache.get(key)
+        if result is None:
+            result = self.ocr.ocr(img, cls=True)
+            self._cache[key] = result
+        return result
+    
+    def warmup(self, size=640):
+        """
+        用一张含有文字的图片执行一次推理，预先完成显存分配和检测、方向分类、识别模型的TensorRT引擎构建，
+        避免首批真实图片承担这部分初始化耗时
+        
+        参数:
+            size: 预热图片的边长
+        """
+        # 空白图片检测不到文本框，方向分类和识别模型不会运行，因此在白底上绘制几行文字
+        img = np.full((size, size, 3), 255, dtype=np.uint8)
+        for i, line in enumerate(('OCR warmup 0123456789', 'PaddleOCR TensorRT', 'ABCDEFG abcdefg')):
+            cv2.putText(img, line, (20, 80 + i * 80), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 3)
+        self.ocr.ocr(img, cls=True)
+        
+        # 检测结果因模型而异，再直接对单行文字执行一次方向分类和识别，确保这两个模型都已预热
+        self.ocr.ocr(img[40:110, :], det=False, cls=True)
     
     def recognize_image(self, img_path):
         """
@@ -43,11 +231,44 @@ class OCRProcessor:
         """
         if not os.path.exists(img_path):
             raise FileNotFoundError(f"图片文件不存在: {img_path}")
+        
+        # 按文件字节计算哈希，命中缓存时无需解码图片
+        data = np.fromfile(img_path, dtype=np.uint8)
+        key = image_key(data)
+        if key in self._cache:
+            return self._cache[key]
+        
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"无法读取图片: {img_path}")
+        return self._recognize_cached(key, img)
+    
+    def recognize_pil(self, pil_img):
+        """
+        直接识别内存中的PIL图片，无需先保存为文件
+        
+        参数:
+            pil_img: PIL.Image图片对象
             
-        result = self.ocr.ocr(img_path, cls=True)
-        return result
+        返回:
+            result: OCR识别结果列表
+        """
+        return self.recognize_array(pil_to_bgr(pil_img))
     
-    def visualize_result(self, img_path, result, output_path=None):
+    def recognize_array(self, img, key=None):
+        """
+        直接识别内存中已解码的图片数组
+        
+        参数:
+            img: 图片数组(BGR格式)
+            key: 缓存键(如按图片编码字节计算的image_key)，默认按图片数组计算
+            
+        返回:
+            result: OCR识别结果列表
+        """
+        return self._recognize_cached(key or image_key(img), img)
+    
+    def visualize_result(self, img_path, result, output_path=None, img=None):
         """
         可视化OCR识别结果
         
@@ -55,6 +276,7 @@ class OCRProcessor:
             img_path: 原始图片路径
             result: OCR识别结果
             output_path: 输出图片路径，默认为None（在当前目录生成带有'_result'后缀的图片）
+            img: 已在内存中的BGR图片数组，提供时不再从img_path读取图片
         
         返回:
             output_path: 输出图片路径
@@ -64,31 +286,19 @@ class OCRProcessor:
             return None
         
         # 读取图片
-        img = cv2.imread(img_path)
         if img is None:
-            raise ValueError(f"无法读取图片: {img_path}")
+            img = read_image(img_path)
         
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        # BGR转RGB只取通道反序的视图，不复制整张图片(draw_ocr内部会复制为连续数组)
+        img = img[:, :, ::-1]
         boxes = [line[0] for line in result[0]]
         txts = [line[1][0] for line in result[0]]
         scores = [line[1][1] for line in result[0]]
         
-        # 绘制结果 - 使用系统字体路径
-        font_path = '/System/Library/Fonts/PingFang.ttc'  # macOS系统中文字体
-        if not os.path.exists(font_path):
-            # 尝试使用其他常见系统字体
-            alternative_fonts = [
-                '/System/Library/Fonts/STHeiti Light.ttc',  # macOS另一个中文字体
-                '/System/Library/Fonts/Hiragino Sans GB.ttc',  # macOS另一个中文字体
-                '/Library/Fonts/Arial Unicode.ttf',  # 通用Unicode字体
-                './fonts/simfang.ttf'  # 回退到原始路径
-            ]
-            for alt_font in alternative_fonts:
-                if os.path.exists(alt_font):
-                    font_path = alt_font
-                    break
-        
-        im_show = draw_ocr(img, boxes, txts, scores, font_path=font_path)
+        # 绘制结果 - 使用初始化时确定的系统字体
+        if self._font_path is None:
+            raise FileNotFoundError(f"找不到可用于绘制识别结果的字体，请确认以下字体之一存在: {', '.join(FONT_PATHS)}")
+        im_show = draw_ocr(img, boxes, txts, scores, font_path=self._font_path)
         im_show = Image.fromarray(im_show)
         
         # 生成输出路径
@@ -140,96 +350,153 @@ class OCRProcessor:
         print(f"文本已保存至: {output_path}")
         return output_path
     
-    def process_directory(self, dir_path, output_dir=None, extensions=('.jpg', '.jpeg', '.png', '.bmp')):
+    def save_result(self, img_path, result, output_dir=None, img=None):
+        """
+        保存单张图片的识别结果(可视化图片和文本)
+        
+        参数:
+            img_path: 原始图片路径
+            result: OCR识别结果
+            output_dir: 输出目录路径，默认为None（在原目录生成结果）
+            img: 已在内存中的BGR图片数组，提供时可视化不再重新读取图片
+        """
+        # 提取文本
+        text = self.extract_text(result)
+        
+        # 确定输出路径
+        if output_dir:
+            img_name = os.path.basename(img_path)
+            name, ext = os.path.splitext(img_name)
+            out_img_path = os.path.join(output_dir, f"{name}_result{ext}")
+            out_txt_path = os.path.join(output_dir, f"{name}_ocr.txt")
+        else:
+            out_img_path = None  # 使用默认路径
+            out_txt_path = None  # 使用默认路径
+        
+        # 可视化结果并保存文本
+        if result and len(result[0]) > 0:  # 只有识别到内容才保存结果
+            self.visualize_result(img_path, result, out_img_path, img=img)
+            self.save_to_txt(text, out_txt_path, img_path)
+        else:
+            print(f"图片 {img_path} 没有识别到任何文字")
+    
+    def process_image(self, img_path, output_dir=None):
+        """
+        识别单张图片，并保存可视化结果和文本
+        
+        参数:
+            img_path: 图片路径
+            output_dir: 输出目录路径，默认为None（在原目录生成结果）
+            
+        返回:
+            result: OCR识别结果
+        """
+        result = self.recognize_image(img_path)
+        self.save_result(img_path, result, output_dir)
+        return result
+    
+    def process_directory(self, dir_path, output_dir=None, extensions=IMAGE_EXTENSIONS, workers=None):
         """
         批量处理目录中的图片
         
+        处理过程分为四个阶段，通过有界队列衔接:
+        (1) 枚举图片路径 (2) 读取并解码图片 (3) 逐张进行OCR识别 (4) 保存结果。
+        前两个阶段在后台线程中运行，识别阶段在当前线程中运行，保存阶段由线程池执行，
+        图片解码、结果绘制与模型推理重叠进行，推理阶段不必等待磁盘读写。
+        模型只在当前线程中调用，GPU模式下同样适用。
+        
         参数:
             dir_path: 图片目录路径
             output_dir: 输出目录路径，默认为None（在原目录生成结果）
             extensions: 支持的图片扩展名元组
+            workers: 保存识别结果的线程数，默认为SAVE_WORKERS
             
         返回:
             results: 处理结果字典，键为图片路径，值为识别结果
         """
-        if not os.path.isdir(dir_path):
-            raise NotADirectoryError(f"目录不存在: {dir_path}")
+        # 获取所有图片文件
+        image_files = list_image_files(dir_path, extensions)
         
         # 如果指定了输出目录且不存在，则创建
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
-        # 获取所有图片文件
-        image_files = []
-        for ext in extensions:
-            image_files.extend(list(Path(dir_path).glob(f"*{ext}")))
-            image_files.extend(list(Path(dir_path).glob(f"*{ext.upper()}")))
-        
         if not image_files:
             print(f"警告: 目录 {dir_path} 中没有找到支持的图片文件")
             return {}
         
         results = {}
         total = len(image_files)
+        done = 0
+        path_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        image_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        # 限制等待保存的图片数，避免保存慢于识别时图片在内存中堆积
+        save_slots = threading.BoundedSemaphore(PIPELINE_QUEUE_SIZE)
         
-        for i, img_path in enumerate(image_files):
-            img_path_str = str(img_path)
-            print(f"正在处理 [{i+1}/{total}]: {img_path_str}")
-            
+        def enumerate_stage():
+            """阶段1: 枚举待处理的图片路径"""
+            for img_path in image_files:
+                path_queue.put(img_path)
+            path_queue.put(_STOP)
+        
+        def decode_stage():
+            """阶段2: 读取并解码图片"""
+            while True:
+                img_path = path_queue.get()
+                if img_path is _STOP:
+                    break
+                try:
+                    img = read_image(img_path)
+                except Exception as e:
+                    print(f"处理图片 {img_path} 时出错: {e}")
+                    img = None
+                image_queue.put((img_path, img))
+            image_queue.put(_STOP)
+        
+        def save_stage(img_path, img, result):
+            """阶段4: 绘制可视化图片并保存识别结果"""
+            # 识别已成功，保存出错也保留识别结果
+            results[img_path] = result
             try:
-                # 识别图片
-                result = self.recognize_image(img_path_str)
-                results[img_path_str] = result
-                
-                # 提取文本
-                text = self.extract_text(result)
-                
-                # 确定输出路径
-                if output_dir:
-                    img_name = os.path.basename(img_path_str)
-                    name, ext = os.path.splitext(img_name)
-                    out_img_path = os.path.join(output_dir, f"{name}_result{ext}")
-                    out_txt_path = os.path.join(output_dir, f"{name}_ocr.txt")
-                else:
-                    out_img_path = None  # 使用默认路径
-                    out_txt_path = None  # 使用默认路径
-                
-                # 可视化结果并保存文本
-                if result and len(result[0]) > 0:  # 只有识别到内容才保存结果
-                    self.visualize_result(img_path_str, result, out_img_path)
-                    self.save_to_txt(text, out_txt_path, img_path_str)
-                else:
-                    print(f"图片 {img_path_str} 没有识别到任何文字")
-            
+                self.save_result(img_path, result, output_dir, img=img)
             except Exception as e:
-                print(f"处理图片 {img_path_str} 时出错: {e}")
+                print(f"处理图片 {img_path} 时出错: {e}")
+            finally:
+                save_slots.release()
+        
+        # Paddle推理和OpenCV解码在C++中执行时会释放GIL，读取线程可与推理并行
+        for stage in (enumerate_stage, decode_stage):
+            threading.Thread(target=stage, daemon=True).start()
+        
+        # 阶段3: 图片出队后立即识别(PaddleOCR 2.x 开启检测时只接受单张图片，文本行识别在其内部按rec_batch_num组批)，
+        # 单张图片识别出错时只跳过该图片
+        with ThreadPoolExecutor(max_workers=workers or SAVE_WORKERS) as saver:
+            while True:
+                item = image_queue.get()
+                if item is _STOP:
+                    break
+                
+                img_path, img = item
+                done += 1
+                if img is None:
+                    continue
+                print(f"正在处理 [{done}/{total}]: {img_path}")
+                try:
+                    result = self.recognize_array(img)
+                except Exception as e:
+                    print(f"识别图片 {img_path} 时出错: {e}")
+                    continue
+                save_slots.acquire()
+                saver.submit(save_stage, img_path, img, result)
         
         return results
 
-def main():
-    parser = argparse.ArgumentParser(description='使用PaddleOCR进行图片文字识别')
-    parser.add_argument('input', help='输入图片路径或目录路径')
-    parser.add_argument('-o', '--output', help='输出目录路径（批量处理时）或输出文件路径（单张图片）')
-    parser.add_argument('-l', '--lang', default='ch', help='识别语言, 默认为中文(ch)', 
-                        choices=['ch', 'en', 'fr', 'german', 'korean', 'japan'])
-    parser.add_argument('--gpu', action='store_true', help='是否使用GPU加速')
-    parser.add_argument('--no-angle-cls', action='store_true', help='不使用方向分类器')
-    parser.add_argument('--txt-only', action='store_true', help='只输出文本文件，不生成可视化图片')
-    
-    args = parser.parse_args()
-    
-    # 初始化OCR处理器
-    processor = OCRProcessor(
-        use_gpu=args.gpu,
-        lang=args.lang,
-        use_angle_cls=not args.no_angle_cls
-    )
-    
-    # 处理输入
+def run(processor, args):
+    """按命令行参数处理输入的图片或目录"""
     input_path = args.input
     if os.path.isdir(input_path):
         # 批量处理目录
-        processor.process_directory(input_path, args.output)
+        processor.process_directory(input_path, args.output, workers=args.workers)
     elif os.path.isfile(input_path):
         # 处理单张图片
         result = processor.recognize_image(input_path)
@@ -267,5 +534,57 @@ def main():
     else:
         print(f"错误: 输入路径 {input_path} 不存在")
 
+def main():
+    parser = argparse.ArgumentParser(description='使用PaddleOCR进行图片文字识别')
+    parser.add_argument('input', help='输入图片路径或目录路径')
+    parser.add_argument('-o', '--output', help='输出目录路径（批量处理时）或输出文件路径（单张图片）')
+    parser.add_argument('-l', '--lang', default='ch', help='识别语言, 默认为中文(ch)', 
+                        choices=['ch', 'en', 'fr', 'german', 'korean', 'japan'])
+    parser.add_argument('--gpu', action='store_true', help='是否使用GPU加速')
+    parser.add_argument('--no-angle-cls', action='store_true', help='不使用方向分类器')
+    parser.add_argument('--txt-only', action='store_true', help='只输出文本文件，不生成可视化图片')
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'int8'], default=None,
+                        help='推理精度，GPU模式默认为fp16，CPU模式默认为fp32')
+    parser.add_argument('--use-tensorrt', dest='use_tensorrt', action='store_true', default=None,
+                        help='使用TensorRT加速(GPU模式默认开启)')
+    parser.add_argument('--no-tensorrt', dest='use_tensorrt', action='store_false',
+                        help='GPU模式下不使用TensorRT')
+    parser.add_argument('--no-mkldnn', dest='enable_mkldnn', action='store_false', default=None,
+                        help='CPU模式下不使用MKL-DNN加速(默认开启)')
+    parser.add_argument('--cpu-threads', type=int, default=None,
+                        help='CPU模式下的推理线程数，默认使用全部CPU核心')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'批量处理时保存识别结果的线程数，默认为{SAVE_WORKERS}')
+    parser.add_argument('--cache-file', help='识别结果缓存文件路径，多次运行之间复用相同图片的识别结果')
+    parser.add_argument('--no-low-memory', dest='low_memory', action='store_false', default=None,
+                        help='CPU模式下关闭低内存模式(默认每次只识别一个文本行以降低常驻内存)')
+    
+    args = parser.parse_args()
+    
+    # 命令行中显式指定的推理参数，其余使用OCRProcessor的高性能默认值
+    ocr_options = {
+        key: value for key, value in (
+            ('precision', args.precision),
+            ('use_tensorrt', args.use_tensorrt),
+            ('enable_mkldnn', args.enable_mkldnn),
+            ('cpu_threads', args.cpu_threads),
+        ) if value is not None
+    }
+    
+    # 初始化OCR处理器
+    processor = OCRProcessor(
+        use_gpu=args.gpu,
+        lang=args.lang,
+        use_angle_cls=not args.no_angle_cls,
+        low_memory=args.low_memory,
+        cache_path=args.cache_file,
+        **ocr_options
+    )
+    
+    try:
+        run(processor, args)
+    finally:
+        processor.close()
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -4,36 +4,115 @@
 """
 PDF文档图片OCR识别示例
 从PDF文档中提取图片，然后使用PaddleOCR进行文字识别
+图片提取、文字识别和结果写出以流水线方式并行进行
 """
 
 import os
 import io
+import queue
+import threading
+import cv2
 import fitz  # PyMuPDF
+import numpy as np
 import argparse
+import functools
 import tempfile
 from PIL import Image
-from pathlib import Path
-from paddleocr_recognition import OCRProcessor
+from paddleocr_recognition import OCRProcessor, image_key, pil_to_bgr
+
+# 流水线中相邻阶段之间缓冲队列的容量(同时驻留内存的图片数上限)
+PIPELINE_QUEUE_SIZE = 16
+# 流水线结束标记
+_STOP = object()
+
+def read_image_bytes(pdf_document, img_info):
+    """
+    读取PDF中一张图片的编码数据
+    
+    JPEG(DCTDecode)图片的原始数据流本身就是完整的JPEG文件，直接读取即可，
+    不经过extract_image的解码和转码；其他编码方式的图片仍使用extract_image提取。
+    
+    参数:
+        pdf_document: fitz.Document对象
+        img_info: page.get_images(full=True)返回的图片信息
+    
+    返回:
+        image_bytes: 可以直接保存为文件或解码的图片数据
+        ext: 图片数据对应的文件扩展名
+    """
+    xref, img_filter = img_info[0], img_info[8]
+    if img_filter == 'DCTDecode':
+        return pdf_document.xref_stream_raw(xref), 'jpeg'
+    base_img = pdf_document.extract_image(xref)
+    return base_img["image"], base_img["ext"]
+
+def decode_image_bytes(image_bytes):
+    """
+    将编码的图片数据直接解码为BGR数组，OpenCV不支持的格式再使用PIL解码
+    
+    参数:
+        image_bytes: 图片数据
+    
+    返回:
+        img: BGR格式的图片数组
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        img = pil_to_bgr(Image.open(io.BytesIO(image_bytes)))
+    return img
+
+def iter_pdf_image_data(pdf_path, min_width=100, min_height=100):
+    """
+    逐张读取PDF文档中图片的编码数据(不解码)
+    
+    参数:
+        pdf_path: PDF文件路径
+        min_width: 最小图片宽度，小于此宽度的图片会被忽略
+        min_height: 最小图片高度，小于此高度的图片会被忽略
+    
+    返回:
+        生成器，依次产出(页码索引, 页内图片索引, 图片在文档中的索引, 图片数据, 扩展名, 宽度, 高度)
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        # 遍历每一页
+        for page_index, page in enumerate(pdf_document):
+            # 处理页面上的每张图片
+            for img_index, img_info in enumerate(page.get_images(full=True)):
+                img_index_in_doc = img_info[0]  # 图片在文档中的索引
+                
+                # 根据图片信息中的宽高忽略过小的图片，无需提取和解码图片数据
+                width, height = img_info[2], img_info[3]
+                if width < min_width or height < min_height:
+                    continue
+                
+                try:
+                    image_bytes, ext = read_image_bytes(pdf_document, img_info)
+                except Exception as e:
+                    print(f"处理图片时出错: {e}")
+                    continue
+                
+                yield page_index, img_index, img_index_in_doc, image_bytes, ext, width, height
 
 def extract_images_from_pdf(pdf_path, output_dir=None, min_width=100, min_height=100):
     """
     从PDF文档中提取图片
     
+    图片数据按原编码格式直接写入文件，不经过PIL解码和重新编码。
+    
     参数:
         pdf_path: PDF文件路径
         output_dir: 输出目录，默认为None(不保存图片文件)
         min_width: 最小图片宽度，小于此宽度的图片会被忽略
         min_height: 最小图片高度，小于此高度的图片会被忽略
-        
+    
     返回:
-        images: 图片对象列表（PIL.Image）
+        images: 图片信息列表，每项为(图片在文档中的索引, 保存的文件路径, 宽度, 高度)，
+                未保存时文件路径为None，需要图片对象时可用PIL.Image.open按路径打开
         image_paths: 保存的图片文件路径列表（如果output_dir为None则为空列表）
     """
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF文件不存在: {pdf_path}")
     
-    # 打开PDF文件
-    pdf_document = fitz.open(pdf_path)
     images = []
     image_paths = []
     
@@ -43,153 +122,281 @@ def extract_images_from_pdf(pdf_path, output_dir=None, min_width=100, min_height
     
     pdf_name = os.path.basename(pdf_path).rsplit('.', 1)[0]
     
-    # 遍历每一页
-    for page_index, page in enumerate(pdf_document):
-        # 获取页面上的图片
-        image_list = page.get_images(full=True)
+    for page_index, img_index, xref, image_bytes, ext, width, height in iter_pdf_image_data(pdf_path, min_width, min_height):
+        img_path = None
         
-        # 处理页面上的每张图片
-        for img_index, img_info in enumerate(image_list):
-            img_index_in_doc = img_info[0]  # 图片在文档中的索引
-            base_img = pdf_document.extract_image(img_index_in_doc)
-            image_bytes = base_img["image"]
-            
-            # 使用PIL打开图片
+        # 保存图片
+        if output_dir:
+            img_path = os.path.join(output_dir, f"{pdf_name}_p{page_index+1}_img{img_index+1}.{ext}")
             try:
-                img = Image.open(io.BytesIO(image_bytes))
-                width, height = img.size
-                
-                # 忽略过小的图片
-                if width < min_width or height < min_height:
+                with open(img_path, 'wb') as f:
+                    f.write(image_bytes)
+                image_paths.append(img_path)
+            except Exception as e:
+                print(f"处理图片时出错: {e}")
+                img_path = None
+        
+        images.append((xref, img_path, width, height))
+    
+    return images, image_paths
+
+def ocr_pdf_images(pdf_path, processor, results_dir, images_dir=None,
+                   min_width=100, min_height=100):
+    """
+    以流水线方式提取PDF中的图片并进行OCR识别
+    
+    处理过程分为三个阶段，通过有界队列衔接:
+    (1) 后台线程逐页提取并解码图片 (2) 当前线程逐张进行OCR识别
+    (3) 后台线程写出每张图片的识别结果。
+    提取阶段按图片编码数据计算哈希，重复出现的图片(如logo、印章)只解码一次，识别时直接复用缓存的结果。
+    图片不经过磁盘直接送入识别和可视化，只有识别结果(以及指定images_dir时的原图)写入磁盘，
+    内存中最多只驻留队列容量数量的图片。
+    
+    参数:
+        pdf_path: PDF文件路径
+        processor: OCRProcessor实例
+        results_dir: 识别结果输出目录
+        images_dir: 提取图片的保存目录，默认为None(不保存图片文件)
+        min_width: 最小图片宽度，小于此宽度的图片会被忽略
+        min_height: 最小图片高度，小于此高度的图片会被忽略
+    
+    返回:
+        image_count: 提取的图片数量
+        all_text: 按图片顺序合并的识别文本行列表
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF文件不存在: {pdf_path}")
+    
+    if images_dir and not os.path.exists(images_dir):
+        os.makedirs(images_dir)
+    
+    pdf_name = os.path.basename(pdf_path).rsplit('.', 1)[0]
+    image_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    result_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    image_count = 0
+    all_text = []
+    
+    def extract_stage():
+        """阶段1: 提取图片，按需保存，首次出现的图片解码为BGR数组"""
+        nonlocal image_count
+        seen_keys = set()
+        try:
+            for page_index, img_index, _, image_bytes, ext, _, _ in iter_pdf_image_data(pdf_path, min_width, min_height):
+                name = f"{pdf_name}_p{page_index+1}_img{img_index+1}"
+                try:
+                    # 原图按原编码格式直接写出，不重新编码
+                    if images_dir:
+                        with open(os.path.join(images_dir, f"{name}.{ext}"), 'wb') as f:
+                            f.write(image_bytes)
+                    
+                    # 重复出现的图片只保留编码数据，识别阶段直接取首次出现时的识别结果，
+                    # 写出阶段需要可视化时再解码。识别结果缓存只在识别线程中访问(shelve不是线程安全的)
+                    key = image_key(image_bytes)
+                    if key in seen_keys:
+                        arr = None
+                    else:
+                        arr = decode_image_bytes(image_bytes)
+                        seen_keys.add(key)
+                except Exception as e:
+                    print(f"处理图片 {name} 时出错: {e}")
+                    continue
+                image_count += 1
+                image_queue.put((name, arr, image_bytes if arr is None else None, key))
+        except Exception as e:
+            print(f"提取PDF图片时出错: {e}")
+        finally:
+            image_queue.put(_STOP)
+    
+    def write_stage():
+        """阶段3: 保存每张图片的识别文本和可视化结果，并汇总文本"""
+        while True:
+            item = result_queue.get()
+            if item is _STOP:
+                break
+            name, img, image_bytes, result = item
+            try:
+                if not result or not result[0]:
+                    print(f"图片 {name} 没有识别到任何文字")
                     continue
                 
-                # 保存图片
-                images.append(img)
+                text = processor.extract_text(result)
                 
-                if output_dir:
-                    img_path = os.path.join(output_dir, f"{pdf_name}_p{page_index+1}_img{img_index+1}.png")
-                    img.save(img_path)
-                    image_paths.append(img_path)
-                    
+                # 先汇总文本，保存或可视化出错时识别到的文本也不会丢失
+                stripped = text.strip()
+                if stripped:
+                    all_text.append(f"--- 图片: {name} ---")
+                    all_text.append(stripped)
+                    all_text.append("")
+                
+                processor.save_to_txt(text, os.path.join(results_dir, f"{name}_ocr.txt"))
+                if img is None:
+                    img = decode_image_bytes(image_bytes)
+                processor.visualize_result(name, result, os.path.join(results_dir, f"{name}_result.png"), img=img)
             except Exception as e:
-                print(f"处理图片时出错: {e}")
+                print(f"保存图片 {name} 的识别结果时出错: {e}")
     
-    return images, image_paths
+    def recognize(name, arr, image_bytes, key):
+        """阶段2: 识别一张图片，结果交给写出阶段"""
+        try:
+            # 重复出现的图片没有解码，直接取首次出现时识别并缓存的结果；
+            # 首次出现时识别失败的图片没有缓存结果，解码后重新识别
+            result = processor.cached_result(key) if arr is None else None
+            if result is None:
+                if arr is None:
+                    arr = decode_image_bytes(image_bytes)
+                result = processor.recognize_array(arr, key)
+        except Exception as e:
+            print(f"识别图片 {name} 时出错: {e}")
+            return
+        result_queue.put((name, arr, image_bytes, result))
+    
+    extractor = threading.Thread(target=extract_stage, daemon=True)
+    writer = threading.Thread(target=write_stage, daemon=True)
+    extractor.start()
+    writer.start()
+    
+    # 图片出队后立即识别，单张图片识别出错时只跳过该图片
+    try:
+        while True:
+            item = image_queue.get()
+            if item is _STOP:
+                break
+            recognize(*item)
+    finally:
+        result_queue.put(_STOP)
+        writer.join()
+    
+    return image_count, all_text
 
-def main():
-    parser = argparse.ArgumentParser(description='PDF文档图片OCR识别示例')
-    parser.add_argument('pdf_path', help='PDF文件路径')
-    parser.add_argument('-o', '--output_dir', help='输出目录路径')
-    parser.add_argument('-l', '--lang', default='ch', help='识别语言, 默认为中文(ch)')
-    parser.add_argument('--gpu', action='store_true', help='是否使用GPU加速')
-    parser.add_argument('--min-width', type=int, default=100, help='最小图片宽度，小于此宽度的图片会被忽略')
-    parser.add_argument('--min-height', type=int, default=100, help='最小图片高度，小于此高度的图片会被忽略')
-    parser.add_argument('--save-images', action='store_true', help='是否保存提取的图片')
+@functools.lru_cache(maxsize=1)
+def get_processor(use_gpu=False, lang='ch', use_angle_cls=True, cache_path=None):
+    """
+    获取OCR处理器，参数相同时复用已创建的实例
     
-    args = parser.parse_args()
+    Paddle模型初始化需要数秒并占用数百MB内存，处理多个PDF时只需初始化一次。
+    GPU模式下创建后先预热，首个PDF不承担显存分配和TensorRT引擎构建的耗时。
+    
+    参数:
+        use_gpu: 是否使用GPU加速
+        lang: 识别语言
+        use_angle_cls: 是否使用方向分类器
+        cache_path: 识别结果缓存文件路径
+    
+    返回:
+        processor: OCRProcessor实例
+    """
+    print("初始化OCR处理器...")
+    processor = OCRProcessor(
+        use_gpu=use_gpu,
+        lang=lang,
+        use_angle_cls=use_angle_cls,
+        cache_path=cache_path
+    )
+    if use_gpu:
+        processor.warmup()
+    return processor
+
+def process_pdf(pdf_path, output_dir=None, processor=None, save_images=False, min_width=100, min_height=100):
+    """
+    识别PDF文档中的图片，保存每张图片和整个文档的识别结果
+    
+    参数:
+        pdf_path: PDF文件路径
+        output_dir: 输出目录路径，默认为None(使用临时目录)
+        processor: OCRProcessor实例，默认为None(使用get_processor()返回的共享实例)
+        save_images: 是否保存提取的图片
+        min_width: 最小图片宽度，小于此宽度的图片会被忽略
+        min_height: 最小图片高度，小于此高度的图片会被忽略
     
+    返回:
+        image_count: 提取的图片数量
+        results_dir: 识别结果目录
+    """
     # 创建输出目录(如果指定的话)
-    if args.output_dir:
-        if not os.path.exists(args.output_dir):
-            os.makedirs(args.output_dir)
-        images_dir = os.path.join(args.output_dir, "images")
-        results_dir = os.path.join(args.output_dir, "results")
+    if output_dir:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
     else:
         # 使用临时目录
-        temp_dir = tempfile.mkdtemp()
-        images_dir = os.path.join(temp_dir, "images")
-        results_dir = os.path.join(temp_dir, "results")
-    
-    # 创建图片目录(如果需要保存图片)
-    if args.save_images:
-        if not os.path.exists(images_dir):
-            os.makedirs(images_dir)
+        output_dir = tempfile.mkdtemp()
+    images_dir = os.path.join(output_dir, "images")
+    results_dir = os.path.join(output_dir, "results")
     
     # 创建结果目录
     if not os.path.exists(results_dir):
         os.makedirs(results_dir)
     
-    # 提取PDF中的图片
-    print(f"正在从PDF文件提取图片: {args.pdf_path}")
-    output_images_dir = images_dir if args.save_images else None
-    images, image_paths = extract_images_from_pdf(
-        args.pdf_path, 
-        output_images_dir,
-        min_width=args.min_width,
-        min_height=args.min_height
-    )
-    
-    print(f"从PDF中提取了 {len(images)} 张图片")
-    
-    if len(images) == 0:
-        print("未找到符合条件的图片，退出程序")
-        return
+    if processor is None:
+        processor = get_processor()
     
-    # 初始化OCR处理器
-    print("初始化OCR处理器...")
-    processor = OCRProcessor(
-        use_gpu=args.gpu,
-        lang=args.lang,
-        use_angle_cls=True
+    # 边提取边识别PDF中的图片，重复出现的图片直接复用缓存的识别结果
+    print(f"正在从PDF文件提取并识别图片: {pdf_path}")
+    image_count, all_text = ocr_pdf_images(
+        pdf_path,
+        processor,
+        results_dir,
+        images_dir if save_images else None,
+        min_width=min_width,
+        min_height=min_height
     )
     
-    # 处理提取的图片
-    all_text = []
+    print(f"从PDF中提取了 {image_count} 张图片")
     
-    if args.save_images:
-        # 如果保存了图片，直接处理图片文件
-        print("处理提取的图片文件...")
-        processor.process_directory(images_dir, results_dir)
-        
-        # 读取所有OCR结果文本
-        for img_path in image_paths:
-            img_name = os.path.basename(img_path).rsplit('.', 1)[0]
-            txt_path = os.path.join(results_dir, f"{img_name}_ocr.txt")
-            if os.path.exists(txt_path):
-                with open(txt_path, 'r', encoding='utf-8') as f:
-                    text = f.read().strip()
-                    if text:
-                        all_text.append(f"--- 图片: {img_name} ---")
-                        all_text.append(text)
-                        all_text.append("")
-    else:
-        # 内存中处理图片对象
-        print("处理提取的图片...")
-        
-        # 创建临时图片文件
-        temp_img_paths = []
-        with tempfile.TemporaryDirectory() as temp_dir:
-            for i, img in enumerate(images):
-                temp_img_path = os.path.join(temp_dir, f"temp_img_{i+1}.png")
-                img.save(temp_img_path)
-                temp_img_paths.append(temp_img_path)
-            
-            # 处理临时图片文件
-            results = processor.process_directory(temp_dir, results_dir)
-            
-            # 读取所有OCR结果文本
-            for i, temp_img_path in enumerate(temp_img_paths):
-                img_name = os.path.basename(temp_img_path).rsplit('.', 1)[0]
-                txt_path = os.path.join(results_dir, f"{img_name}_ocr.txt")
-                if os.path.exists(txt_path):
-                    with open(txt_path, 'r', encoding='utf-8') as f:
-                        text = f.read().strip()
-                        if text:
-                            all_text.append(f"--- 图片 {i+1} ---")
-                            all_text.append(text)
-                            all_text.append("")
+    if image_count == 0:
+        print("未找到符合条件的图片")
+        return image_count, results_dir
     
     # 合并所有OCR结果
     if all_text:
-        pdf_name = os.path.basename(args.pdf_path).rsplit('.', 1)[0]
+        pdf_name = os.path.basename(pdf_path).rsplit('.', 1)[0]
         combined_txt_path = os.path.join(results_dir, f"{pdf_name}_all_ocr.txt")
         with open(combined_txt_path, 'w', encoding='utf-8') as f:
             f.write("\n".join(all_text))
         print(f"合并OCR结果已保存至: {combined_txt_path}")
     
+    return image_count, results_dir
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF文档图片OCR识别示例')
+    parser.add_argument('pdf_paths', nargs='+', metavar='pdf_path', help='PDF文件路径，可指定多个')
+    parser.add_argument('-o', '--output_dir', help='输出目录路径')
+    parser.add_argument('-l', '--lang', default='ch', help='识别语言, 默认为中文(ch)')
+    parser.add_argument('--gpu', action='store_true', help='是否使用GPU加速')
+    parser.add_argument('--min-width', type=int, default=100, help='最小图片宽度，小于此宽度的图片会被忽略')
+    parser.add_argument('--min-height', type=int, default=100, help='最小图片高度，小于此高度的图片会被忽略')
+    parser.add_argument('--save-images', action='store_true', help='是否保存提取的图片')
+    parser.add_argument('--cache-file', help='识别结果缓存文件路径，多次运行之间复用相同图片的识别结果')
+    
+    args = parser.parse_args()
+    
+    # 未指定输出目录时，所有PDF的结果放在同一个临时目录中
+    output_dir = args.output_dir or tempfile.mkdtemp()
+    
+    # 所有PDF共用一个OCR处理器
+    processor = get_processor(use_gpu=args.gpu, lang=args.lang, cache_path=args.cache_file)
+    
+    total_images = 0
+    try:
+        for pdf_path in args.pdf_paths:
+            try:
+                image_count, results_dir = process_pdf(
+                    pdf_path,
+                    output_dir,
+                    processor,
+                    save_images=args.save_images,
+                    min_width=args.min_width,
+                    min_height=args.min_height
+                )
+            except Exception as e:
+                print(f"处理PDF文件 {pdf_path} 时出错: {e}")
+                continue
+            total_images += image_count
+    finally:
+        processor.close()
+    
     print("\n处理完成!")
-    print(f"处理图片数量: {len(images)}")
-    print(f"识别结果保存在: {results_dir}")
+    print(f"处理图片数量: {total_images}")
+    print(f"识别结果保存在: {os.path.join(output_dir, 'results')}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -10,27 +10,105 @@
 import os
 import sys
 import zipfile
-import shutil
-import tempfile
-import xml.etree.ElementTree as ET
+from lxml import etree
 
 # 定义DOCX中XML命名空间
 namespaces = {
     'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
     'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
     'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture',
-    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'
 }
 
-def register_namespaces():
-    """注册XML命名空间"""
-    for prefix, uri in namespaces.items():
-        ET.register_namespace(prefix, uri)
+# 需要修改或跳过的DOCX部件
+DOCUMENT_PART = 'word/document.xml'
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+MEDIA_PREFIX = 'word/media/'
+
+# 重新打包时依次最先写出的部件，Office等读取程序可以顺序读取而不必来回查找
+LEADING_PARTS = ('[Content_Types].xml', '_rels/.rels', DOCUMENT_PART, DOCUMENT_RELS_PART)
+
+# 重新打包时的deflate压缩级别: 未修改的部件需要重新压缩，使用最快的级别
+ZIP_COMPRESS_LEVEL = 1
+
+# 一次遍历同时匹配所有包含图片的元素: drawing(图片)、pict(较旧格式的图片)、object(嵌入对象)
+_IMAGE_ELEMENTS_XPATH = etree.XPath('//w:drawing | //w:pict | //w:object', namespaces=namespaces)
+_W_DRAWING = '{%s}drawing' % namespaces['w']
+_W_PICT = '{%s}pict' % namespaces['w']
+
+# 指向图片的关系
+_IMAGE_RELS_XPATH = etree.XPath(
+    '/rel:Relationships/rel:Relationship[@Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"]',
+    namespaces=namespaces
+)
+
+def ordered_parts(zip_file):
+    """
+    返回按写出顺序排列的压缩包部件: LEADING_PARTS在前，其余部件保持原有顺序
+    
+    Args:
+        zip_file (zipfile.ZipFile): 原DOCX压缩包
+    
+    Returns:
+        list: ZipInfo列表
+    """
+    rank = {name: i for i, name in enumerate(LEADING_PARTS)}
+    return sorted(zip_file.infolist(), key=lambda info: rank.get(info.filename, len(LEADING_PARTS)))
+
+# 大文档也能解析，且不为ID属性建立索引
+_XML_PARSER = etree.XMLParser(huge_tree=True, collect_ids=False)
+
+def remove_image_elements(xml_data):
+    """
+    删除document.xml中所有包含图片的元素
+    
+    Args:
+        xml_data (bytes): document.xml的内容
+    
+    Returns:
+        tuple: (修改后的XML内容, drawing数, pict数, object数)
+    """
+    root = etree.fromstring(xml_data, _XML_PARSER)
+    
+    # 查找并删除所有drawing、pict和object元素
+    drawings_removed = picts_removed = objects_removed = 0
+    for element in _IMAGE_ELEMENTS_XPATH(root):
+        element.getparent().remove(element)
+        if element.tag == _W_DRAWING:
+            drawings_removed += 1
+        elif element.tag == _W_PICT:
+            picts_removed += 1
+        else:
+            objects_removed += 1
+    
+    xml_data = etree.tostring(root, encoding='UTF-8', xml_declaration=True, standalone=True)
+    return xml_data, drawings_removed, picts_removed, objects_removed
+
+def remove_image_relationships(xml_data):
+    """
+    删除关系文件中指向图片的关系
+    
+    Args:
+        xml_data (bytes): document.xml.rels的内容
+    
+    Returns:
+        tuple: (修改后的XML内容, 删除的关系数)
+    """
+    root = etree.fromstring(xml_data, _XML_PARSER)
+    img_rels = _IMAGE_RELS_XPATH(root)
+    for rel in img_rels:
+        root.remove(rel)
+    xml_data = etree.tostring(root, encoding='UTF-8', xml_declaration=True, standalone=True)
+    return xml_data, len(img_rels)
 
 def remove_images_from_docx(input_path, output_path=None):
     """
     通过直接操作DOCX内部结构来删除所有图片
     
+    逐个读取原DOCX压缩包中的部件并直接写入新的压缩包，不解压到临时目录:
+    document.xml删除图片元素，关系文件删除图片引用，media目录下的图片文件直接跳过，其余部件原样写出。
+    
     Args:
         input_path (str): 输入docx文件路径
         output_path (str, optional): 输出docx文件路径。如果未提供，将生成'无图片_' + 原文件名
@@ -48,56 +126,38 @@ def remove_images_from_docx(input_path, output_path=None):
         file_name = os.path.basename(input_path)
         output_path = os.path.join(file_dir, "无图片_" + file_name)
     
-    # 创建临时目录
-    temp_dir = tempfile.mkdtemp()
+    # 先写入同目录下的临时文件，完成后再替换，输出路径与输入路径相同时也能正常处理
+    tmp_output_path = output_path + '.tmp'
     try:
-        # 解压DOCX文件到临时目录
-        with zipfile.ZipFile(input_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        # 注册命名空间
-        register_namespaces()
+        media_files = 0
+        with zipfile.ZipFile(input_path, 'r') as zin, \
+                zipfile.ZipFile(tmp_output_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+            for info in ordered_parts(zin):
+                name = info.filename
+                
+                # 跳过media文件夹（包含所有图片文件）
+                if name.startswith(MEDIA_PREFIX):
+                    media_files += 1
+                    continue
+                
+                data = zin.read(info)
+                if name == DOCUMENT_PART:
+                    # 处理document.xml文件(主文档内容)
+                    data, drawings_removed, picts_removed, objects_removed = remove_image_elements(data)
+                    print(f"已从文档中移除 {drawings_removed} 个drawing元素、{picts_removed} 个pict元素和 {objects_removed} 个object元素")
+                elif name == DOCUMENT_RELS_PART:
+                    # 清理文档关系文件中的图片引用
+                    data, rels_removed = remove_image_relationships(data)
+                    print(f"已从关系文件中删除 {rels_removed} 个图片引用")
+                
+                # 沿用原部件的ZipInfo，保留文件名、时间戳和压缩方式
+                zout.writestr(info, data, compresslevel=ZIP_COMPRESS_LEVEL)
         
-        # 处理document.xml文件(主文档内容)
-        doc_path = os.path.join(temp_dir, 'word', 'document.xml')
-        if os.path.exists(doc_path):
-            tree = ET.parse(doc_path)
-            root = tree.getroot()
-            
-            # 查找并删除所有drawing元素（包含图片）
-            drawings_removed = 0
-            for drawing in root.findall('.//w:drawing', namespaces):
-                drawing.getparent().remove(drawing)
-                drawings_removed += 1
-            
-            # 查找并删除所有pict元素（包含较旧格式的图片）
-            picts_removed = 0
-            for pict in root.findall('.//w:pict', namespaces):
-                pict.getparent().remove(pict)
-                picts_removed += 1
-            
-            # 保存修改后的XML
-            tree.write(doc_path, encoding='UTF-8', xml_declaration=True)
-            
-            print(f"已从文档中移除 {drawings_removed} 个drawing元素和 {picts_removed} 个pict元素")
+        os.replace(tmp_output_path, output_path)
         
-        # 删除media文件夹（包含所有图片文件）
-        media_dir = os.path.join(temp_dir, 'word', 'media')
-        if os.path.exists(media_dir):
-            media_files = len(os.listdir(media_dir))
-            shutil.rmtree(media_dir)
+        if media_files:
             print(f"已删除media文件夹中的 {media_files} 个文件")
         
-        # 重新打包DOCX文件
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root_dir, _, files in os.walk(temp_dir):
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    zipf.write(
-                        file_path, 
-                        os.path.relpath(file_path, temp_dir)
-                    )
-        
         print(f"新文档已保存至: {output_path}")
         return output_path
         
@@ -106,9 +166,9 @@ def remove_images_from_docx(input_path, output_path=None):
         return None
     
     finally:
-        # 清理临时目录
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        # 清理未完成的临时文件
+        if os.path.exists(tmp_output_path):
+            os.remove(tmp_output_path)
 
 def main():
     """主函数，处理命令行参数并执行图片移除操作"""
@@ -12,7 +12,18 @@ import sys
 from docx import Document
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
+from docx.opc.constants import CONTENT_TYPE as CT
 from docx.shared import Inches
+from lxml import etree
+
+# 一次遍历匹配所有图片和图形元素: drawing(内联及浮动图片)、pict(旧式图片)、object(嵌入对象)
+_NS = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+_IMAGE_ELEMENTS_XPATH = etree.XPath('//w:drawing | //w:pict | //w:object', namespaces=_NS)
+_W_R = qn('w:r')
+_W_RPR = qn('w:rPr')
+
+# 需要删除图片的部件: 正文、页眉和页脚
+_CONTENT_PARTS = (CT.WML_DOCUMENT_MAIN, CT.WML_HEADER, CT.WML_FOOTER)
 
 def remove_images_from_document(input_path, output_path=None):
     """
@@ -42,39 +53,19 @@ def remove_images_from_document(input_path, output_path=None):
         # 查找并移除所有图片
         removed_count = 0
         
-        # 处理文档中的内联图片
-        for para in doc.paragraphs:
-            # 遍历段落中的所有运行(run)
-            runs_to_remove = []
-            for i, run in enumerate(para.runs):
-                # 检查运行中是否有图片元素
-                if run._element.findall('.//a:graphic', {'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'}):
-                    runs_to_remove.append(i)
-                    removed_count += 1
-            
-            # 从后向前删除，避免索引变化
-            for idx in sorted(runs_to_remove, reverse=True):
-                para._p.remove(para.runs[idx]._element)
-        
-        # 处理表格中的图片
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        runs_to_remove = []
-                        for i, run in enumerate(para.runs):
-                            if run._element.findall('.//a:graphic', {'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'}):
-                                runs_to_remove.append(i)
-                                removed_count += 1
-                        
-                        # 从后向前删除
-                        for idx in sorted(runs_to_remove, reverse=True):
-                            para._p.remove(para.runs[idx]._element)
-        
-        # 处理文档中的浮动图片和图形
-        for element in doc._element.xpath('//w:drawing | //w:pict'):
-            element.getparent().remove(element)
-            removed_count += 1
+        # 对正文、页眉和页脚各执行一次XPath，删除其中所有图片和图形元素(包括表格和文本框内的)
+        for part in doc.part.package.iter_parts():
+            if part.content_type not in _CONTENT_PARTS:
+                continue
+            for element in _IMAGE_ELEMENTS_XPATH(part.element):
+                run = element.getparent()
+                run.remove(element)
+                removed_count += 1
+                
+                # 只包含图片的运行(run)删除图片后只剩格式属性，一并删除
+                paragraph = run.getparent()
+                if run.tag == _W_R and paragraph is not None and all(child.tag == _W_RPR for child in run):
+                    paragraph.remove(run)
         
         # 保存新文档
         doc.save(output_path)
@@ -11,14 +11,174 @@
 import os
 import sys
 import zipfile
-import shutil
-import tempfile
 from lxml import etree
 
+# 定义命名空间
+nsmap = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture',
+    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'
+}
+
+# 需要修改或跳过的DOCX部件
+DOCUMENT_PART = 'word/document.xml'
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+MEDIA_PREFIX = 'word/media/'
+
+# 重新打包时依次最先写出的部件，Office等读取程序可以顺序读取而不必来回查找
+LEADING_PARTS = ('[Content_Types].xml', '_rels/.rels', DOCUMENT_PART, DOCUMENT_RELS_PART)
+
+# 重新打包时的deflate压缩级别: 未修改的部件需要重新压缩，使用最快的级别
+ZIP_COMPRESS_LEVEL = 1
+
+# 依次删除的图片元素: 内联图片(drawing)、旧式图片(pict)、其他可能包含图片的元素(object)
+_IMAGE_XPATHS = [
+    etree.XPath('.//w:drawing', namespaces=nsmap),
+    etree.XPath('.//w:pict', namespaces=nsmap),
+    etree.XPath('.//w:object', namespaces=nsmap),
+]
+W_BODY = '{%s}body' % nsmap['w']
+
+def ordered_parts(zip_file):
+    """
+    返回按写出顺序排列的压缩包部件: LEADING_PARTS在前，其余部件保持原有顺序
+    
+    Args:
+        zip_file (zipfile.ZipFile): 原DOCX压缩包
+    
+    Returns:
+        list: ZipInfo列表
+    """
+    rank = {name: i for i, name in enumerate(LEADING_PARTS)}
+    return sorted(zip_file.infolist(), key=lambda info: rank.get(info.filename, len(LEADING_PARTS)))
+
+def _namespace_declarations(element):
+    """返回元素可见命名空间的声明字节串列表，用于去除子元素序列化结果中的重复声明"""
+    return [
+        (b' xmlns:%s="%s"' % (prefix.encode(), uri.encode())) if prefix else (b' xmlns="%s"' % uri.encode())
+        for prefix, uri in element.nsmap.items()
+    ]
+
+def _serialize(element, inherited_declarations, start_tag_only=False):
+    """
+    序列化元素，并去除开始标签中已在根元素上声明过的命名空间
+    
+    Args:
+        element: 要序列化的元素
+        inherited_declarations (list): 根元素上的命名空间声明
+        start_tag_only (bool): 只输出开始标签(不含子元素)
+    
+    Returns:
+        bytes: 序列化结果
+    """
+    if start_tag_only:
+        element = etree.Element(element.tag, element.attrib, nsmap=element.nsmap)
+    data = etree.tostring(element, encoding='UTF-8', with_tail=False)
+    if data.startswith(b'<?xml'):
+        data = data[data.index(b'?>') + 2:].lstrip()
+    
+    head_end = data.index(b'>')
+    head = data[:head_end]
+    for declaration in inherited_declarations:
+        head = head.replace(declaration, b'', 1)
+    if start_tag_only:
+        # 去掉空元素的自闭合标记
+        return head.rstrip(b'/') + b'>'
+    return head + data[head_end:]
+
+def _end_tag(element):
+    """返回元素的结束标签"""
+    qname = etree.QName(element)
+    tag = f"{element.prefix}:{qname.localname}" if element.prefix else qname.localname
+    return f"</{tag}>".encode('UTF-8')
+
+def remove_image_elements(src, dst):
+    """
+    流式删除document.xml中所有图片元素
+    
+    使用iterparse逐个解析body下的顶层元素(段落、表格等)，删除其中的图片元素后立即写出并释放，
+    内存占用与文档大小无关，只与单个顶层元素的大小有关。
+    
+    Args:
+        src: document.xml的输入流
+        dst: 修改后的document.xml的输出流
+    
+    Returns:
+        int: 删除的图片元素数
+    """
+    img_count = 0
+    depth = 0
+    root_declarations = []
+    
+    dst.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+    for event, element in etree.iterparse(src, events=('start', 'end'), remove_blank_text=True, huge_tree=True):
+        if event == 'start':
+            # 根元素和body只写出开始标签，其子元素在结束时整体写出
+            if depth == 0:
+                root_declarations = _namespace_declarations(element)
+                dst.write(_serialize(element, [], start_tag_only=True))
+            elif depth == 1 and element.tag == W_BODY:
+                dst.write(_serialize(element, root_declarations, start_tag_only=True))
+            depth += 1
+            continue
+        
+        depth -= 1
+        parent = element.getparent()
+        if depth == 0 or (depth == 1 and element.tag == W_BODY):
+            dst.write(_end_tag(element))
+            continue
+        
+        # 只处理body下的顶层元素，以及根元素下除body外的其他元素(如背景)
+        if not (depth == 2 and parent.tag == W_BODY) and depth != 1:
+            continue
+        
+        # 查找并删除所有图片元素
+        for xpath in _IMAGE_XPATHS:
+            for image in xpath(element):
+                image.getparent().remove(image)
+                img_count += 1
+        
+        dst.write(_serialize(element, root_declarations))
+        
+        # 释放已写出的元素
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del parent[0]
+    
+    return img_count
+
+def remove_image_relationships(xml_data, parser):
+    """
+    删除关系文件中指向图片的关系
+    
+    Args:
+        xml_data (bytes): document.xml.rels的内容
+        parser: lxml的XML解析器
+    
+    Returns:
+        tuple: (修改后的XML内容, 删除的关系数)
+    """
+    rels_root = etree.fromstring(xml_data, parser)
+    
+    # 删除指向图片的关系
+    img_rels = rels_root.xpath('//rel:Relationship[@Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"]', 
+                               namespaces=nsmap)
+    for rel in img_rels:
+        rel.getparent().remove(rel)
+    
+    xml_data = etree.tostring(rels_root, encoding='UTF-8', xml_declaration=True, pretty_print=True)
+    return xml_data, len(img_rels)
+
 def remove_images_from_docx(input_path, output_path=None):
     """
     使用lxml解析DOCX并删除所有图片
     
+    逐个读取原DOCX压缩包中的部件并直接写入新的压缩包，不解压到临时目录:
+    document.xml流式删除图片元素，关系文件删除图片引用，media目录下的图片文件直接跳过，其余部件原样写出。
+    
     Args:
         input_path (str): 输入docx文件路径
         output_path (str, optional): 输出docx文件路径。如果未提供，将生成'无图片_' + 原文件名
@@ -36,89 +196,46 @@ def remove_images_from_docx(input_path, output_path=None):
         file_name = os.path.basename(input_path)
         output_path = os.path.join(file_dir, "无图片_" + file_name)
     
-    # 创建临时目录
-    temp_dir = tempfile.mkdtemp()
+    # 先写入同目录下的临时文件，完成后再替换，输出路径与输入路径相同时也能正常处理
+    tmp_output_path = output_path + '.tmp'
     try:
-        # 解压DOCX文件到临时目录
-        with zipfile.ZipFile(input_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        # 定义命名空间
-        nsmap = {
-            'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-            'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-            'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture',
-            'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
-            'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
-        }
-        
-        # 处理document.xml文件(主文档内容)
-        doc_path = os.path.join(temp_dir, 'word', 'document.xml')
-        if os.path.exists(doc_path):
-            # 解析XML
-            parser = etree.XMLParser(remove_blank_text=True)
-            tree = etree.parse(doc_path, parser)
-            root = tree.getroot()
-            
-            # 查找并删除所有图片元素
-            img_count = 0
-            
-            # 删除内联图片 - drawing元素
-            drawings = root.xpath('//w:drawing', namespaces=nsmap)
-            for drawing in drawings:
-                drawing.getparent().remove(drawing)
-                img_count += 1
-            
-            # 删除旧式图片 - pict元素
-            picts = root.xpath('//w:pict', namespaces=nsmap)
-            for pict in picts:
-                pict.getparent().remove(pict)
-                img_count += 1
-            
-            # 删除其他可能包含图片的元素
-            shapes = root.xpath('//w:object', namespaces=nsmap)
-            for shape in shapes:
-                shape.getparent().remove(shape)
-                img_count += 1
-            
-            # 保存修改后的XML
-            tree.write(doc_path, encoding='UTF-8', xml_declaration=True, pretty_print=True)
-            
-            print(f"已从文档中移除 {img_count} 个图片元素")
-        
-        # 删除media文件夹（包含所有图片文件）
-        media_dir = os.path.join(temp_dir, 'word', 'media')
-        if os.path.exists(media_dir):
-            media_files = len(os.listdir(media_dir))
-            shutil.rmtree(media_dir)
-            print(f"已删除media文件夹中的 {media_files} 个文件")
-        
-        # 清理文档关系文件中的图片引用
-        rels_path = os.path.join(temp_dir, 'word', '_rels', 'document.xml.rels')
-        if os.path.exists(rels_path):
-            try:
-                rels_tree = etree.parse(rels_path, parser)
-                rels_root = rels_tree.getroot()
+        parser = etree.XMLParser(remove_blank_text=True)
+        media_files = 0
+        with zipfile.ZipFile(input_path, 'r') as zin, \
+                zipfile.ZipFile(tmp_output_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+            for info in ordered_parts(zin):
+                name = info.filename
+                
+                # 跳过media文件夹（包含所有图片文件）
+                if name.startswith(MEDIA_PREFIX):
+                    media_files += 1
+                    continue
                 
-                # 删除指向图片的关系
-                img_rels = rels_root.xpath('//r:Relationship[@Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"]', 
-                                        namespaces=nsmap)
-                for rel in img_rels:
-                    rel.getparent().remove(rel)
+                if name == DOCUMENT_PART:
+                    # 处理document.xml文件(主文档内容)，边解析边写入新的压缩包；
+                    # ZipFile.open()不接受compresslevel参数，通过ZipInfo指定压缩级别
+                    info._compresslevel = ZIP_COMPRESS_LEVEL
+                    with zin.open(info) as src, zout.open(info, 'w') as dst:
+                        img_count = remove_image_elements(src, dst)
+                    print(f"已从文档中移除 {img_count} 个图片元素")
+                    continue
                 
-                # 保存修改后的关系文件
-                rels_tree.write(rels_path, encoding='UTF-8', xml_declaration=True, pretty_print=True)
-                print(f"已从关系文件中删除 {len(img_rels)} 个图片引用")
-            except Exception as e:
-                print(f"清理关系文件时出错: {str(e)}")
+                data = zin.read(info)
+                if name == DOCUMENT_RELS_PART:
+                    # 清理文档关系文件中的图片引用
+                    try:
+                        data, rels_removed = remove_image_relationships(data, parser)
+                        print(f"已从关系文件中删除 {rels_removed} 个图片引用")
+                    except Exception as e:
+                        print(f"清理关系文件时出错: {str(e)}")
+                
+                # 沿用原部件的ZipInfo，保留文件名、时间戳和压缩方式
+                zout.writestr(info, data, compresslevel=ZIP_COMPRESS_LEVEL)
+        
+        os.replace(tmp_output_path, output_path)
         
-        # 重新打包DOCX文件
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root_dir, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    arcname = os.path.relpath(file_path, temp_dir)
-                    zipf.write(file_path, arcname)
+        if media_files:
+            print(f"已删除media文件夹中的 {media_files} 个文件")
         
         print(f"新文档已保存至: {output_path}")
         return output_path
@@ -128,9 +245,9 @@ def remove_images_from_docx(input_path, output_path=None):
         return None
     
     finally:
-        # 清理临时目录
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        # 清理未完成的临时文件
+        if os.path.exists(tmp_output_path):
+            os.remove(tmp_output_path)
 
 def main():
     """主函数，处理命令行参数并执行图片移除操作"""